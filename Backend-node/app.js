@@ -13,7 +13,7 @@ import chatRoutes from "./routes/Chat.routes.js";
 import pipelineRoutes from "./routes/pipeline.routes.js";
 import notificationRoutes from "./routes/notification.routes.js";
 import { initializeFirebase } from "./services/pushNotification.service.js";
-import { initCronJobs, initReminderJob } from "./cron.js";
+import { initCronJobs, initReminderJob, initArchiveJob } from "./cron.js";
 
 
 // Initialize Firebase Admin SDK
@@ -31,6 +31,7 @@ if (firebaseServiceAccount) {
 connectDB().then(() => {
   initCronJobs();  // safe to start after DB is ready
   initReminderJob(); // start reminder cron (env-driven schedule)
+  initArchiveJob();  // pack closed conversations on the Python service
 });
 
 const app = express();
@@ -11,6 +11,7 @@
  *   npm install node-cron
  */
 
+import axios from "axios";
 import cron from "node-cron";
 import { runPipelineForAllUsers } from "./services/pipeline.service.js";
 import { sendPushNotification } from "./services/pushNotification.service.js";
@@ -149,3 +150,69 @@ export const initReminderJob = () => {
 
   console.log(`[cron] Reminder job scheduled — "${REMINDER_SCHEDULE}" (tz: ${process.env.TZ || 'UTC'})`);
 };
+
+// ---------------- Archive job ----------------
+// Packs closed conversations on the Python service. The endpoint handles a
+// bounded batch per call, so keep calling until a round archives nothing.
+
+const PY_ARCHIVE_URL =
+  process.env.PY_ARCHIVE_URL ||
+  new URL(
+    "/maintenance/archive-conversations",
+    process.env.PY_SENTIMENT_URL || "http://127.0.0.1:8000/analyze"
+  ).toString();
+const ARCHIVE_MAX_ROUNDS = Number(process.env.ARCHIVE_MAX_ROUNDS || 20);
+
+let isArchiveRunning = false;
+
+const runArchiveJob = async () => {
+  if (isArchiveRunning) {
+    console.warn('[cron] Archive job already running — skipping this tick.');
+    return;
+  }
+
+  isArchiveRunning = true;
+  const start = Date.now();
+  let archived = 0;
+  let bytesSaved = 0;
+
+  try {
+    for (let round = 0; round < ARCHIVE_MAX_ROUNDS; round++) {
+      const { data } = await axios.post(PY_ARCHIVE_URL, null, {
+        headers: { 'X-Maintenance-Token': process.env.MAINTENANCE_TOKEN },
+        timeout: 120000,
+      });
+      archived += data.archived;
+      bytesSaved += data.bytes_saved;
+      if (!data.archived) break;
+    }
+
+    const elapsed = ((Date.now() - start) / 1000).toFixed(1);
+    console.log(`[cron] Archive job finished in ${elapsed}s — archived: ${archived}, bytes saved: ${bytesSaved}`);
+  } catch (err) {
+    const detail = err?.response?.data?.detail || err?.message || err;
+    console.error(`[cron] Archive job failed after ${archived} conversation(s):`, detail);
+  } finally {
+    isArchiveRunning = false;
+  }
+};
+
+export const initArchiveJob = () => {
+  // Must match MAINTENANCE_TOKEN on the Python service, which disables the
+  // endpoint entirely when it is unset
+  if (!process.env.MAINTENANCE_TOKEN) {
+    console.warn('[cron] MAINTENANCE_TOKEN not set — conversation archive job NOT started.');
+    return;
+  }
+
+  const ARCHIVE_SCHEDULE = process.env.CRON_ARCHIVE_SCHEDULE || '30 3 * * *';
+
+  if (!cron.validate(ARCHIVE_SCHEDULE)) {
+    console.error(`[cron] Invalid CRON_ARCHIVE_SCHEDULE "${ARCHIVE_SCHEDULE}". Archive job NOT started.`);
+    return;
+  }
+
+  cron.schedule(ARCHIVE_SCHEDULE, runArchiveJob, { timezone: process.env.TZ || 'UTC' });
+
+  console.log(`[cron] Archive job scheduled — "${ARCHIVE_SCHEDULE}" (tz: ${process.env.TZ || 'UTC'})`);
+};
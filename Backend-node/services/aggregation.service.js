@@ -16,6 +16,11 @@
  *   comparable regardless of window size.
  * • llmContext is a short English sentence injected into the Gemini system
  *   prompt to give the bot instant emotional awareness.
+ *
+ * NOTE: the pipeline no longer calls this module. AggregatedEmotion is owned
+ * by the Python service (/analytics/emotions), which folds new results into
+ * a half-life decayed state; running this full rescan as well would make
+ * llmContext flip between the two models.
  */
 
 import mongoose from "mongoose";
@@ -3,8 +3,10 @@
  *
  * Orchestrates the full sentiment pipeline for one user:
  *   1. Fetch Reddit content  (reddit.service)
- *   2. Run sentiment analysis on NEW, unanalysed content only (batch)
- *   3. Compute aggregated emotion  (aggregation.service)
+ *   2. Run sentiment analysis on NEW, unanalysed content only (batch) and
+ *      fold the new results into the user's emotion state on the Python
+ *      service (/analytics/emotions), which maintains AggregatedEmotion
+ *      and its llmContext incrementally
  *
  * Each stage is independently error-tolerant: a failure in one stage is
  * captured and reported without crashing the others where possible.
@@ -14,8 +16,7 @@ import mongoose from "mongoose";
 import RedditContent from "../Models/RedditContent.model.js";
 import SentimentResult from "../Models/SentimentResult.model.js";
 import { fetchAuthenticatedUserContent } from "./reddit.service.js";
-import { analyzeText } from "./sentiment.service.js";
-import { computeAndSaveAggregation } from "./aggregation.service.js";
+import { analyzeText, ingestEmotionResults } from "./sentiment.service.js";
 import User from "../Models/User.model.js";
 
 // ─── Config ──────────────────────────────────────────────────────────────────
@@ -78,6 +79,10 @@ const stageFetchReddit = async (user) => {
 /**
  * Stage 2 – Batch-analyse only content that has no SentimentResult yet.
  * Uses Promise.allSettled per batch so one bad item does not block others.
+ *
+ * Each batch is sent to the Python emotion state before its SentimentResults
+ * are saved: if the ingest fails the items stay unanalysed and are retried
+ * on the next run instead of being missing from the aggregate.
  */
 const stageBatchAnalyze = async (userId) => {
   // Find all content IDs that already have a result
@@ -88,17 +93,18 @@ const stageBatchAnalyze = async (userId) => {
 
   // Fetch only unanalysed content
   const pending = await RedditContent.find({ userId })
-    .select("_id text")
+    .select("_id text createdAt")
     .lean();
 
   const toAnalyze = pending.filter((c) => !analyzedIds.has(c._id.toString()));
 
   if (!toAnalyze.length) {
-    return { analyzed: 0, skipped: pending.length, failed: 0 };
+    return { analyzed: 0, skipped: pending.length, failed: 0, dominantEmotion: null };
   }
 
   let analyzedCount = 0;
   let failedCount   = 0;
+  let latestDominant = null;
 
   // Process in batches
   for (let i = 0; i < toAnalyze.length; i += BATCH_SIZE) {
@@ -107,9 +113,33 @@ const stageBatchAnalyze = async (userId) => {
     const results = await Promise.allSettled(
       batch.map(async (content) => {
         const raw = await analyzeText(content.text);
-        const { emotionScores, dominantEmotion } = normalizeClassifierResult(raw);
+        // Some transformers versions nest a single string's output one level deeper
+        const result = Array.isArray(raw?.[0]) ? raw[0] : raw;
+        return { content, result };
+      })
+    );
+
+    const scored = [];
+    for (const r of results) {
+      if (r.status === "fulfilled") scored.push(r.value);
+      else {
+        failedCount++;
+        console.error("[pipeline] sentiment analysis item failed:", r.reason?.message);
+      }
+    }
+    if (!scored.length) continue;
 
-        await SentimentResult.findOneAndUpdate(
+    // Throws on failure: nothing from this batch is saved, so it is retried next run
+    const ingest = await ingestEmotionResults(
+      userId,
+      scored.map(({ content, result }) => ({ result, createdAt: content.createdAt }))
+    );
+    latestDominant = ingest.dominant_emotion ?? latestDominant;
+
+    const saved = await Promise.allSettled(
+      scored.map(({ content, result }) => {
+        const { emotionScores, dominantEmotion } = normalizeClassifierResult(result);
+        return SentimentResult.findOneAndUpdate(
           { contentId: content._id },
           { $set: { contentId: content._id, emotionScores, dominantEmotion } },
           { upsert: true, new: true, setDefaultsOnInsert: true }
@@ -117,11 +147,11 @@ const stageBatchAnalyze = async (userId) => {
       })
     );
 
-    for (const r of results) {
+    for (const r of saved) {
       if (r.status === "fulfilled") analyzedCount++;
       else {
         failedCount++;
-        console.error("[pipeline] sentiment analysis item failed:", r.reason?.message);
+        console.error("[pipeline] saving sentiment result failed:", r.reason?.message);
       }
     }
 
@@ -133,6 +163,7 @@ const stageBatchAnalyze = async (userId) => {
     analyzed: analyzedCount,
     skipped:  pending.length - toAnalyze.length,
     failed:   failedCount,
+    dominantEmotion: latestDominant,
   };
 };
 
@@ -154,7 +185,7 @@ export const runPipelineForUser = async (userId) => {
 
   const result = {
     userId,
-    stages: { fetch: null, analyze: null, aggregate: null },
+    stages: { fetch: null, analyze: null },
     success: false,
     error: null,
   };
@@ -170,25 +201,12 @@ export const runPipelineForUser = async (userId) => {
   }
 
   try {
-    // ── Stage 2: Batch Analyse ──────────────────────────────────────────────
+    // ── Stage 2: Batch Analyse + Ingest ─────────────────────────────────────
     result.stages.analyze = await stageBatchAnalyze(userId);
-  } catch (err) {
-    result.stages.analyze = { error: err.message };
-    // Aggregation might still work on previously stored results — don't abort
-    console.warn(`[pipeline] Analyze stage failed for ${userId}:`, err.message);
-  }
-
-  try {
-    // ── Stage 3: Aggregate ──────────────────────────────────────────────────
-    const agg = await computeAndSaveAggregation(userId);
-    result.stages.aggregate = {
-      dominantEmotion: agg.dominantEmotion,
-      contentCount:    agg.windowMeta?.contentCount,
-    };
     result.success = true;
   } catch (err) {
-    result.stages.aggregate = { error: err.message };
-    result.error = `Aggregate stage failed: ${err.message}`;
+    result.stages.analyze = { error: err.message };
+    result.error = `Analyze stage failed: ${err.message}`;
   }
 
   return result;
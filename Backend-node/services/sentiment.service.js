@@ -16,7 +16,34 @@ import RedditContent from "../Models/RedditContent.model.js";
 import SentimentResult from "../Models/SentimentResult.model.js";
 
 const PY_SENTIMENT_URL = process.env.PY_SENTIMENT_URL || "http://127.0.0.1:8000/analyze";
+const PY_ANALYTICS_URL =
+  process.env.PY_ANALYTICS_URL || new URL("/analytics/emotions", PY_SENTIMENT_URL).toString();
 const PY_SENTIMENT_TIMEOUT_MS = Number(process.env.PY_SENTIMENT_TIMEOUT_MS || 15000);
+// The Python service admits only a few batch requests at a time and answers
+// 429/503 with Retry-After beyond that, so stay within its limits and back off
+const PY_SENTIMENT_CONCURRENCY = Number(process.env.PY_SENTIMENT_CONCURRENCY || 2);
+const PY_SENTIMENT_MAX_RETRIES = Number(process.env.PY_SENTIMENT_MAX_RETRIES || 5);
+const PY_SENTIMENT_CLIENT_ID = process.env.PY_SENTIMENT_CLIENT_ID || "ren-node-pipeline";
+// The client ID is only honoured alongside the secret shared with the Python
+// service (ADMISSION_CLIENT_SECRET there); without it we are keyed by address
+const PY_SENTIMENT_CLIENT_SECRET = process.env.PY_SENTIMENT_CLIENT_SECRET || "";
+const PY_CLIENT_HEADERS = {
+  "X-Client-ID": PY_SENTIMENT_CLIENT_ID,
+  ...(PY_SENTIMENT_CLIENT_SECRET && { "X-Client-Secret": PY_SENTIMENT_CLIENT_SECRET }),
+};
+const RETRYABLE_STATUSES = new Set([429, 503]);
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * Delay before the next attempt: the server's Retry-After when given,
+ * otherwise exponential backoff starting at 1 s.
+ */
+const retryDelayMs = (error, attempt) => {
+  const retryAfter = Number(error?.response?.headers?.["retry-after"]);
+  if (Number.isFinite(retryAfter) && retryAfter >= 0) return retryAfter * 1000;
+  return Math.min(1000 * 2 ** attempt, 30000);
+};
 
 const normalizeClassifierResult = (result) => {
   // Common HF pipeline output: [{ label: "joy", score: 0.91 }, ...]
@@ -55,27 +82,94 @@ const normalizeClassifierResult = (result) => {
   return { emotionScores: { raw: result }, dominantEmotion: "unknown" };
 };
 
+/**
+ * POST to the Python service as a batch client, retrying 429/503 responses.
+ * Resolves to the response body.
+ */
+const postToPython = async (url, body, fallbackMessage) => {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      const response = await axios.post(url, body, {
+        timeout: PY_SENTIMENT_TIMEOUT_MS,
+        headers: PY_CLIENT_HEADERS,
+      });
+      return response.data;
+    } catch (error) {
+      if (
+        RETRYABLE_STATUSES.has(error?.response?.status) &&
+        attempt < PY_SENTIMENT_MAX_RETRIES
+      ) {
+        await sleep(retryDelayMs(error, attempt));
+        continue;
+      }
+
+      const message =
+        error?.response?.data?.detail ||
+        error?.message ||
+        fallbackMessage;
+      throw new Error(message);
+    }
+  }
+};
+
 export const analyzeText = async (text) => {
   if (!text || typeof text !== "string" || !text.trim()) {
     throw new Error("text must be a non-empty string");
   }
 
-  try {
-    const response = await axios.post(
-      PY_SENTIMENT_URL,
-      { text: text.trim() },
-      { timeout: PY_SENTIMENT_TIMEOUT_MS }
-    );
+  const data = await postToPython(
+    PY_SENTIMENT_URL,
+    { text: text.trim() },
+    "Failed to call Python sentiment service"
+  );
 
-    // Supports both { result: ... } and raw payload
-    return response.data?.result ?? response.data;
-  } catch (error) {
-    const message =
-      error?.response?.data?.detail ||
-      error?.message ||
-      "Failed to call Python sentiment service";
-    throw new Error(message);
-  }
+  // Supports both { result: ... } and raw payload
+  return data?.result ?? data;
+};
+
+/**
+ * Fold new analyzeText outputs into the user's emotion state on the Python
+ * service, which owns AggregatedEmotion (scores, topEmotions, llmContext).
+ *
+ * @param {string} userId
+ * @param {Array<{result: Array<{label: string, score: number}>, createdAt: Date}>} items
+ * @returns {Promise<object>} The Python ingest summary
+ */
+export const ingestEmotionResults = async (userId, items) => {
+  if (!items.length) return { ingested: 0 };
+
+  return postToPython(
+    PY_ANALYTICS_URL,
+    {
+      user_id: String(userId),
+      results: items.map((item) => item.result),
+      timestamps: items.map((item) => new Date(item.createdAt).toISOString()),
+    },
+    "Failed to ingest emotion results"
+  );
+};
+
+/**
+ * Run `worker` over `items` with at most `limit` calls in flight.
+ * Resolves to Promise.allSettled-style results in input order.
+ */
+const mapWithConcurrency = async (items, limit, worker) => {
+  const results = new Array(items.length);
+  let next = 0;
+
+  const runners = Array.from({ length: Math.min(limit, items.length) }, async () => {
+    while (next < items.length) {
+      const index = next++;
+      try {
+        results[index] = { status: "fulfilled", value: await worker(items[index]) };
+      } catch (reason) {
+        results[index] = { status: "rejected", reason };
+      }
+    }
+  });
+
+  await Promise.all(runners);
+  return results;
 };
 
 /**
@@ -95,8 +189,10 @@ export const analyzeUserRedditContent = async (userId) => {
 
   if (!contents.length) return [];
 
-  const settled = await Promise.allSettled(
-    contents.map(async (content) => {
+  const settled = await mapWithConcurrency(
+    contents,
+    PY_SENTIMENT_CONCURRENCY,
+    async (content) => {
       const raw = await analyzeText(content.text);
       const { emotionScores, dominantEmotion } = normalizeClassifierResult(raw);
 
@@ -111,10 +207,18 @@ export const analyzeUserRedditContent = async (userId) => {
         dominantEmotion: saved.dominantEmotion,
         emotionScores: saved.emotionScores,
       };
-    })
+    }
   );
 
-  // Keep successful ones; if needed, failed items can be logged.
+  const failed = settled.filter((r) => r.status === "rejected");
+  if (failed.length) {
+    console.warn(
+      `[sentiment.service] ${failed.length}/${contents.length} items failed for user ${userId}: ` +
+        failed[0].reason?.message
+    );
+  }
+
+  // Keep successful ones; failed items are picked up on the next pipeline run
   return settled
     .filter((r) => r.status === "fulfilled")
     .map((r) => r.value);
@@ -5,6 +5,13 @@ from routes.conversationRoutes import router as conversationRouter
 from dotenv import load_dotenv
 import uvicorn
 from routes.sentimentRoutes import router as sentimentRouter
+from routes.metricsRoutes import router as metricsRouter
+from routes.analyticsRoutes import router as analyticsRouter
+from routes.debugRoutes import router as debugRouter
+from routes.maintenanceRoutes import router as maintenanceRouter
+from services.persistenceQueue import startPersistenceQueue, stopPersistenceQueue
+from utils.tracing import TracingMiddleware
+from utils.admission import AdmissionControlMiddleware
 
 load_dotenv()  # Load GEMINI_API_KEY from .env
 
@@ -13,10 +20,25 @@ app = FastAPI()
 def root():
     return {"status": "running", "message": "API is working 🚀"}
 
+@app.on_event("startup")
+async def on_startup():
+    # Replays any journaled chat writes left over from the last run
+    await startPersistenceQueue()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    # Drains the write-behind queue so no chat replies are left unpersisted
+    await stopPersistenceQueue()
+
 origins = [
     "*",  # Allow all origins (can be restricted to your frontend URLs)
 ]
 
+# Both are plain ASGI middleware so they cover streamed response bodies too.
+# Admission is added first so it runs inside the request trace.
+app.add_middleware(AdmissionControlMiddleware)
+app.add_middleware(TracingMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,           # or list of frontend URLs
@@ -28,6 +50,10 @@ app.add_middleware(
 app.include_router(geminiRouter, prefix="/api")
 app.include_router(conversationRouter, prefix="/api")
 app.include_router(sentimentRouter)  # exposes POST /analyze
+app.include_router(metricsRouter)    # exposes GET /metrics
+app.include_router(analyticsRouter)  # exposes /analytics/emotions endpoints
+app.include_router(debugRouter)      # exposes POST /debug/profile
+app.include_router(maintenanceRouter)  # exposes POST /maintenance/archive-conversations
 
 
 #command to run the server
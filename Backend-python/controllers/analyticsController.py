@@ -0,0 +1,42 @@
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from services.emotionAnalyticsService import ingestEmotionResults, getEmotionTrends
+from services.sentimentService import analyze_text
+
+async def ingestEmotions(user_id: str, texts: list, results: list, timestamps: list | None):
+    #Controller for folding new sentiment outputs into a user's emotion state
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="user_id must be a valid ObjectId")
+
+    if not texts and not results:
+        raise HTTPException(status_code=400, detail="Either texts or results is required")
+
+    try:
+        # Raw texts are classified here, off the event loop; pipelines that
+        # already hold analyze_text outputs can send them directly as results
+        combined = list(results) + [await run_in_threadpool(analyze_text, text) for text in texts]
+        return await ingestEmotionResults(user_id, combined, timestamps)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error ingesting emotions: {str(e)}"
+        )
+
+
+async def getTrends(user_id: str, window: str, periods: int):
+    #Controller for windowed emotion trends
+    if not ObjectId.is_valid(user_id):
+        raise HTTPException(status_code=400, detail="user_id must be a valid ObjectId")
+
+    try:
+        return await getEmotionTrends(user_id, window, periods)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error fetching emotion trends: {str(e)}"
+        )
@@ -1,5 +1,8 @@
+from datetime import datetime, timezone
+from typing import Optional
 from fastapi import HTTPException
-from services.conversationService import getConversationsWithMessages, closeActiveConversation
+from fastapi.responses import StreamingResponse
+from services.conversationService import getConversationsWithMessages, closeActiveConversation, streamConversationExport
 
 async def getConversations(user_id: str, page: int):
     #Controller for getting conversations with pagination
@@ -33,3 +36,24 @@ async def closeConversation(user_id: str):
             detail=f"Error closing conversation: {str(e)}"
         )
 
+
+def exportConversations(user_id: str, start: Optional[datetime], end: Optional[datetime], compress: bool):
+    #Controller for streaming a full conversation export
+    if not user_id:
+        raise HTTPException(status_code=400, detail="user_id is required")
+
+    # Mongo returns naive UTC datetimes, so compare against naive UTC bounds
+    start, end = (
+        d.astimezone(timezone.utc).replace(tzinfo=None) if d and d.tzinfo else d
+        for d in (start, end)
+    )
+
+    if start and end and start > end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+
+    filename = f"conversations-{user_id}.ndjson" + (".gz" if compress else "")
+    return StreamingResponse(
+        streamConversationExport(user_id, start, end, compress),
+        media_type="application/gzip" if compress else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
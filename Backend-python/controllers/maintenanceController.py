@@ -0,0 +1,28 @@
+import os
+import secrets
+from typing import Optional
+from fastapi import HTTPException
+from services.archiveService import archiveClosedConversations
+
+# Maintenance jobs are disabled unless a token is configured
+MAINTENANCE_TOKEN = os.getenv("MAINTENANCE_TOKEN", "")
+
+def _require_maintenance_token(token: Optional[str]):
+    if not MAINTENANCE_TOKEN:
+        raise HTTPException(status_code=404, detail="Maintenance endpoints are disabled")
+    if not token or not secrets.compare_digest(token, MAINTENANCE_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid maintenance token")
+
+
+async def archiveConversations(token: Optional[str], limit: int, min_age_hours: float):
+    #Controller for packing closed conversations into compact archives
+    _require_maintenance_token(token)
+
+    try:
+        response = await archiveClosedConversations(limit, min_age_hours)
+        return response
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error archiving conversations: {str(e)}"
+        )
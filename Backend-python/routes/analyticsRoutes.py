@@ -0,0 +1,46 @@
+from datetime import datetime
+from typing import Any, List, Optional
+from fastapi import APIRouter, Query
+from pydantic import BaseModel, Field
+from controllers.analyticsController import ingestEmotions, getTrends
+
+router = APIRouter(tags=["Analytics"])
+
+class EmotionScore(BaseModel):
+    label: str
+    score: float
+
+class IngestEmotionsRequest(BaseModel):
+    user_id: str
+    texts: List[str] = Field(default_factory=list, description="Raw texts to classify and fold in")
+    results: List[List[EmotionScore]] = Field(default_factory=list, description="Existing /analyze outputs")
+    timestamps: Optional[List[datetime]] = Field(
+        None, description="Creation time per item (results first, then texts); defaults to now"
+    )
+
+
+@router.post("/analytics/emotions")
+async def ingest_emotions(payload: IngestEmotionsRequest) -> dict[str, Any]:
+
+    # Fold new sentiment outputs into the user's running emotion state.
+    # Cost is proportional to the number of new items, not the user's history.
+
+    # Example: POST /analytics/emotions
+    # Body: {"user_id": "691985d7...", "results": [[{"label": "joy", "score": 0.8}, ...]]}
+
+    results = [[entry.model_dump() for entry in result] for result in payload.results]
+    return await ingestEmotions(payload.user_id, payload.texts, results, payload.timestamps)
+
+
+@router.get("/analytics/emotions/trends")
+async def emotion_trends(
+    user_id: str = Query(..., description="User's unique ID"),
+    window: str = Query("daily", pattern="^(daily|weekly)$", description="Trend granularity"),
+    periods: int = Query(7, ge=1, description="Number of recent days/weeks to return"),
+) -> dict[str, Any]:
+
+    # Daily/weekly emotion distributions and dominant-emotion shifts
+
+    # Example: /analytics/emotions/trends?user_id=691985d7...&window=weekly&periods=4
+
+    return await getTrends(user_id, window, periods)
@@ -1,5 +1,7 @@
+from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, HTTPException, Query
-from controllers.conversationController import getConversations, closeConversation
+from controllers.conversationController import getConversations, closeConversation, exportConversations
 from pydantic import BaseModel
 
 router = APIRouter()
@@ -44,4 +46,21 @@ async def close_active_conversation(request: CloseConversationRequest):
         response = await closeConversation(request.user_id)
         return response
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/conversations/export")
+async def export_conversations(
+    user_id: str = Query(..., description="User's unique ID"),
+    start: Optional[datetime] = Query(None, description="Only messages created at or after this time"),
+    end: Optional[datetime] = Query(None, description="Only messages created at or before this time"),
+    gzip: bool = Query(False, description="Gzip-compress the stream"),
+):
+
+    # Stream every conversation and message for a user as NDJSON.
+    # One {"type": "conversation"} line precedes that conversation's
+    # {"type": "message"} lines.
+
+    # Example: /conversations/export?user_id=691985d719a05b6423f9f74b&gzip=true
+
+    return exportConversations(user_id, start, end, gzip)
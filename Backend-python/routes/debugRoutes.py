@@ -0,0 +1,21 @@
+from typing import Any
+from fastapi import APIRouter, HTTPException, Query, status
+from utils.profiler import PROFILER_ENABLED, PROFILER_OUTPUT_DIR, profileWindow
+
+router = APIRouter(tags=["Debug"])
+
+@router.post("/debug/profile", status_code=status.HTTP_202_ACCEPTED)
+async def start_profile_window(
+    seconds: float = Query(30, gt=0, description="How long to sample for"),
+) -> dict[str, Any]:
+
+    # Sample the event loop for a time window and dump collapsed stacks
+    # to PROFILER_OUTPUT_DIR. Requires PROFILER_ENABLED.
+
+    # Example: POST /debug/profile?seconds=60
+
+    if not PROFILER_ENABLED:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profiling is disabled")
+    if not profileWindow(seconds):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="A profile is already running")
+    return {"success": True, "seconds": seconds, "output_dir": PROFILER_OUTPUT_DIR}
@@ -0,0 +1,25 @@
+from typing import Any, Optional
+from fastapi import APIRouter, Header, Query
+from controllers.maintenanceController import archiveConversations
+from services.archiveService import ARCHIVE_BATCH_SIZE, ARCHIVE_MIN_AGE_HOURS
+
+router = APIRouter(tags=["Maintenance"])
+
+@router.post("/maintenance/archive-conversations")
+async def archive_closed_conversations(
+    limit: int = Query(ARCHIVE_BATCH_SIZE, ge=1, le=5000, description="Max conversations to pack in this run"),
+    min_age_hours: float = Query(ARCHIVE_MIN_AGE_HOURS, ge=0, description="Only pack conversations closed at least this long ago"),
+    x_maintenance_token: Optional[str] = Header(None, description="Must match MAINTENANCE_TOKEN"),
+) -> dict[str, Any]:
+
+    # Pack closed conversations into one compressed blob plus a small
+    # offset/timestamp index. Reads stay transparent. Called nightly by the
+    # Node archive cron (initArchiveJob in Backend-node/cron.js, schedule
+    # CRON_ARCHIVE_SCHEDULE) until "archived" returns 0; both services need
+    # the same MAINTENANCE_TOKEN.
+    # Runs in the batch admission class, so it never takes interactive slots.
+
+    # Example: POST /maintenance/archive-conversations?limit=500
+    # Header: X-Maintenance-Token: <MAINTENANCE_TOKEN>
+
+    return await archiveConversations(x_maintenance_token, limit, min_age_hours)
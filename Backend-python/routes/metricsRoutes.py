@@ -0,0 +1,18 @@
+from typing import Any
+from fastapi import APIRouter
+from services.persistenceQueue import getQueueStats
+from services.archiveService import getArchiveStats
+from utils.admission import getAdmissionStats
+from utils.tracing import getTracingStats
+
+router = APIRouter(tags=["Metrics"])
+
+@router.get("/metrics")
+async def metrics() -> dict[str, Any]:
+    # Operational counters for in-process subsystems
+    return {
+        "persistence_queue": getQueueStats(),
+        "admission": getAdmissionStats(),
+        "archive": getArchiveStats(),
+        "tracing": getTracingStats(),
+    }
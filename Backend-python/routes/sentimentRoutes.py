@@ -1,5 +1,6 @@
 from typing import Any
 from fastapi import APIRouter, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel, Field
 from services.sentimentService import analyze_text
 
@@ -11,7 +12,8 @@ class AnalyzeRequest(BaseModel):
 @router.post("/analyze", status_code=status.HTTP_200_OK)
 async def analyze(payload: AnalyzeRequest) -> dict[str, Any]:
     try:
-        result = analyze_text(payload.text)
+        # Inference runs off the event loop so batch scoring never stalls chat requests
+        result = await run_in_threadpool(analyze_text, payload.text)
         return {"result": result}
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
@@ -0,0 +1,257 @@
+"""
+Compact storage for closed conversations.
+
+Once closeActiveConversation marks a conversation inactive it is never
+modified again, so its per-message documents can be packed:
+
+  archive.blob     – zlib-compressed JSON lines, one per message, with short
+                     keys and updated_at dropped when it equals created_at
+  archive.index    – little-endian packed arrays of each message's byte
+                     offset in the decompressed blob and its created_at
+                     (ms since epoch). Readers use the timestamps to order
+                     or range-filter messages without decompressing, and the
+                     offsets to parse only the lines they actually need
+
+The archive replaces the `messages` array on the same conversation document,
+so queries by user_id / active keep working. Readers should always go
+through conversationMessages() / messageTimestamps(), which work on both
+packed and unpacked conversations.
+"""
+
+import json
+import os
+import struct
+import time
+import zlib
+from datetime import datetime, timedelta
+
+import bson
+from bson import Binary
+
+from config.db import db
+from utils.tracing import span
+
+ARCHIVE_CODEC = "zlib-jsonl-v1"
+ARCHIVE_MIN_AGE_HOURS = float(os.getenv("ARCHIVE_MIN_AGE_HOURS", "24"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "200"))
+ARCHIVE_COMPRESSION_LEVEL = int(os.getenv("ARCHIVE_COMPRESSION_LEVEL", "9"))
+
+_EPOCH = datetime(1970, 1, 1)
+
+_stats = {
+    "conversations_archived": 0,
+    "messages_archived": 0,
+    "raw_bytes": 0,
+    "packed_bytes": 0,
+    "bytes_saved": 0,
+    "decodes": 0,
+    "decode_ms_total": 0.0,
+}
+
+
+def _to_ms(value: datetime | None) -> int | None:
+    # Mongo stores millisecond precision, so this round-trips exactly
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return (value - _EPOCH) // timedelta(milliseconds=1)
+
+
+def _from_ms(value: int | None) -> datetime | None:
+    return None if value is None else _EPOCH + timedelta(milliseconds=value)
+
+
+# ---------------------------------------------------------------------------
+# ENCODE / DECODE
+# ---------------------------------------------------------------------------
+
+def packMessages(messages: list) -> dict:
+    """Pack a list of message dicts into the archive sub-document."""
+    lines = []
+    offsets = []
+    created = []
+    position = 0
+
+    for msg in messages:
+        created_ms = _to_ms(msg.get("created_at"))
+        updated_ms = _to_ms(msg.get("updated_at"))
+        record = {"r": msg.get("role"), "c": msg.get("content"), "t": created_ms}
+        if updated_ms != created_ms:
+            record["u"] = updated_ms
+
+        line = (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+        offsets.append(position)
+        created.append(created_ms if created_ms is not None else -1)
+        lines.append(line)
+        position += len(line)
+
+    blob = zlib.compress(b"".join(lines), ARCHIVE_COMPRESSION_LEVEL)
+    count = len(messages)
+    return {
+        "codec": ARCHIVE_CODEC,
+        "message_count": count,
+        "blob": Binary(blob),
+        "index": {
+            "offsets": Binary(struct.pack(f"<{count}I", *offsets)),
+            "created_at": Binary(struct.pack(f"<{count}q", *created)),
+        },
+        "first_message_at": messages[0].get("created_at") if messages else None,
+        "last_message_at": messages[-1].get("created_at") if messages else None,
+    }
+
+
+def archiveTimestamps(archive: dict) -> list:
+    """created_at of every archived message, read from the index alone."""
+    count = archive["message_count"]
+    return [
+        None if ms == -1 else _from_ms(ms)
+        for ms in struct.unpack(f"<{count}q", archive["index"]["created_at"])
+    ]
+
+
+def unpackMessages(archive: dict, positions: list[int] | None = None) -> list:
+    """
+    Decode an archive sub-document back into plain message dicts.
+    With `positions`, only those messages are parsed, in the order given.
+    """
+    if archive.get("codec") != ARCHIVE_CODEC:
+        raise ValueError(f"Unsupported archive codec: {archive.get('codec')}")
+
+    count = archive["message_count"]
+    if positions is None:
+        positions = range(count)
+
+    started = time.perf_counter()
+    with span("archive_decode", messages=len(positions)):
+        payload = zlib.decompress(archive["blob"])
+        offsets = struct.unpack(f"<{count}I", archive["index"]["offsets"]) + (len(payload),)
+
+        messages = []
+        for i in positions:
+            record = json.loads(payload[offsets[i]:offsets[i + 1]])
+            created_at = _from_ms(record.get("t"))
+            messages.append({
+                "role": record.get("r"),
+                "content": record.get("c"),
+                "created_at": created_at,
+                "updated_at": _from_ms(record["u"]) if "u" in record else created_at,
+            })
+
+    _stats["decodes"] += 1
+    _stats["decode_ms_total"] += (time.perf_counter() - started) * 1000
+    return messages
+
+
+def isArchived(conv: dict) -> bool:
+    return "archive" in conv and "messages" not in conv
+
+
+def _in_range(created_at: datetime | None, start: datetime | None, end: datetime | None) -> bool:
+    # Messages without a timestamp are never filtered out
+    if created_at is None:
+        return True
+    return not ((start and created_at < start) or (end and created_at > end))
+
+
+def messageTimestamps(conv: dict) -> list:
+    """created_at of every message, without decoding archived content."""
+    if isArchived(conv):
+        return archiveTimestamps(conv["archive"])
+    return [msg.get("created_at") for msg in conv.get("messages", [])]
+
+
+def conversationMessages(conv: dict, start: datetime | None = None, end: datetime | None = None) -> list:
+    """
+    Messages of a conversation document, whether packed or not, optionally
+    limited to those created within [start, end]. For archives the range is
+    resolved from the timestamp index, so out-of-range conversations are
+    never decompressed and out-of-range lines are never parsed.
+    """
+    if not isArchived(conv):
+        messages = conv.get("messages", [])
+        if start or end:
+            messages = [m for m in messages if _in_range(m.get("created_at"), start, end)]
+        return messages
+
+    archive = conv["archive"]
+    if not (start or end):
+        return unpackMessages(archive)
+
+    positions = [
+        i for i, created_at in enumerate(archiveTimestamps(archive))
+        if _in_range(created_at, start, end)
+    ]
+    return unpackMessages(archive, positions) if positions else []
+
+
+# ---------------------------------------------------------------------------
+# ARCHIVAL JOB
+# ---------------------------------------------------------------------------
+
+async def archiveClosedConversations(limit: int = ARCHIVE_BATCH_SIZE, min_age_hours: float = ARCHIVE_MIN_AGE_HOURS):
+    """
+    Pack up to `limit` closed conversations that were closed at least
+    `min_age_hours` ago.
+
+    Returns:
+        Dictionary with how many conversations were packed and the bytes saved
+    """
+    cutoff = datetime.utcnow() - timedelta(hours=min_age_hours)
+    cursor = db.conversations.find(
+        {
+            "active": False,
+            "closed_at": {"$lte": cutoff},
+            "messages": {"$exists": True},
+        },
+        {"messages": 1},
+        batch_size=50,
+    ).limit(limit)
+
+    archived = 0
+    raw_total = 0
+    packed_total = 0
+
+    async for conv in cursor:
+        messages = conv.get("messages", [])
+        archive = packMessages(messages)
+
+        raw_bytes = len(bson.encode({"messages": messages}))
+        packed_bytes = len(bson.encode({"archive": archive}))
+        archive["raw_bytes"] = raw_bytes
+        archive["packed_bytes"] = packed_bytes
+
+        # Re-check the filter so a conversation reopened in the meantime is left alone
+        result = await db.conversations.update_one(
+            {"_id": conv["_id"], "active": False, "messages": {"$exists": True}},
+            {"$set": {"archive": archive}, "$unset": {"messages": ""}},
+        )
+        if result.modified_count:
+            archived += 1
+            raw_total += raw_bytes
+            packed_total += packed_bytes
+            _stats["messages_archived"] += len(messages)
+
+    _stats["conversations_archived"] += archived
+    _stats["raw_bytes"] += raw_total
+    _stats["packed_bytes"] += packed_total
+    _stats["bytes_saved"] += raw_total - packed_total
+
+    return {
+        "success": True,
+        "archived": archived,
+        "raw_bytes": raw_total,
+        "packed_bytes": packed_total,
+        "bytes_saved": raw_total - packed_total,
+        "compression_ratio": round(raw_total / packed_total, 2) if packed_total else None,
+    }
+
+
+def getArchiveStats() -> dict:
+    """Snapshot of archival counters for the metrics endpoint."""
+    decodes = _stats["decodes"]
+    return {
+        **_stats,
+        "decode_ms_total": round(_stats["decode_ms_total"], 2),
+        "decode_ms_avg": round(_stats["decode_ms_total"] / decodes, 3) if decodes else None,
+    }
@@ -1,7 +1,16 @@
 from config.db import db
+from services.persistenceQueue import flushUser
+from services.archiveService import conversationMessages, messageTimestamps, isArchived, unpackMessages
 from bson import ObjectId
 from datetime import datetime
-from typing import List, Dict
+from typing import List, Dict, AsyncIterator, Optional
+import json
+import zlib
+
+EXPORT_BATCH_SIZE = 20        # conversations fetched per cursor round trip
+EXPORT_FLUSH_EVERY = 100      # gzip sync-flush interval, in lines
+
+_export_index_ready = False
 
 # async def getConversationsWithMessages(user_id: str, page: int = 1, max_messages_per_page: int = 100):
     
@@ -127,6 +136,9 @@ async def getConversationsWithMessages(user_id: str, page: int = 1, messages_per
         Dictionary with messages and pagination info
     """
     
+    # Make sure the user's own write-behind replies are visible
+    await flushUser(user_id)
+
     # Get all user conversations sorted by most recent
     all_conversations = await db.conversations.find(
         {"user_id": user_id}
@@ -146,27 +158,16 @@ async def getConversationsWithMessages(user_id: str, page: int = 1, messages_per
             }
         }
     
-    # Flatten all messages from all conversations with metadata
-    all_messages = []
-    for conv in all_conversations:
-        conversation_id = str(conv["_id"])
-        messages = conv.get("messages", [])
-        
-        for msg in messages:
-            all_messages.append({
-                "conversation_id": conversation_id,
-                "conversation_active": conv.get("active", False),
-                "conversation_created_at": conv.get("created_at"),
-                "conversation_updated_at": conv.get("updated_at"),
-                "role": msg.get("role"),
-                "content": msg.get("content"),
-                "created_at": msg.get("created_at"),
-                "updated_at": msg.get("updated_at")
-            })
+    # Order every message by timestamp alone; archived conversations are
+    # ordered from their index and only decoded if they land on this page
+    entries = []
+    for conv_pos, conv in enumerate(all_conversations):
+        for msg_pos, created_at in enumerate(messageTimestamps(conv)):
+            entries.append((created_at, conv_pos, msg_pos))
     
     # Calculate pagination
-    all_messages.sort(key=lambda x: x["created_at"], reverse=True)  
-    total_messages = len(all_messages)
+    entries.sort(key=lambda x: x[0], reverse=True)  
+    total_messages = len(entries)
     total_pages = (total_messages + messages_per_page - 1) // messages_per_page  # Ceiling division
     
     # Handle invalid page number
@@ -178,7 +179,32 @@ async def getConversationsWithMessages(user_id: str, page: int = 1, messages_per
     # Get messages for the requested page
     start_index = (page - 1) * messages_per_page
     end_index = start_index + messages_per_page
-    messages_to_send = all_messages[start_index:end_index]
+    page_entries = entries[start_index:end_index]
+
+    # Decode just the archived lines that appear on this page
+    decoded = {}
+    wanted: Dict[int, List[int]] = {}
+    for _, conv_pos, msg_pos in page_entries:
+        if isArchived(all_conversations[conv_pos]):
+            wanted.setdefault(conv_pos, []).append(msg_pos)
+    for conv_pos, positions in wanted.items():
+        messages = unpackMessages(all_conversations[conv_pos]["archive"], positions)
+        decoded.update({(conv_pos, pos): msg for pos, msg in zip(positions, messages)})
+
+    messages_to_send = []
+    for _, conv_pos, msg_pos in page_entries:
+        conv = all_conversations[conv_pos]
+        msg = decoded.get((conv_pos, msg_pos)) or conv["messages"][msg_pos]
+        messages_to_send.append({
+            "conversation_id": str(conv["_id"]),
+            "conversation_active": conv.get("active", False),
+            "conversation_created_at": conv.get("created_at"),
+            "conversation_updated_at": conv.get("updated_at"),
+            "role": msg.get("role"),
+            "content": msg.get("content"),
+            "created_at": msg.get("created_at"),
+            "updated_at": msg.get("updated_at")
+        })
     
     return {
         "success": True,
@@ -204,6 +230,9 @@ async def closeActiveConversation(user_id: str):
     
     # Close user's active conversation by setting active to False
     
+    # A queued write would otherwise re-open the conversation via upsert
+    await flushUser(user_id)
+
     result = await db.conversations.update_one(
         {
             "user_id": user_id,
@@ -229,3 +258,108 @@ async def closeActiveConversation(user_id: str):
         "message": "Active conversation closed successfully"
     }
 
+
+def _export_default(value):
+    # datetimes and ObjectIds are the only non-JSON types in conversation docs
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Cannot serialise {type(value).__name__}")
+
+
+def _export_line(record: dict) -> bytes:
+    return (json.dumps(record, default=_export_default, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+async def _iterExportLines(
+    user_id: str,
+    start: Optional[datetime],
+    end: Optional[datetime],
+) -> AsyncIterator[bytes]:
+    global _export_index_ready
+    if not _export_index_ready:
+        # Lets the export walk one user's conversations in created_at order
+        # without an in-memory sort, however long their history is
+        await db.conversations.create_index([("user_id", 1), ("created_at", 1)])
+        _export_index_ready = True
+
+    # Conversations overlapping [start, end]; messages are filtered individually
+    query: Dict = {"user_id": user_id}
+    if start:
+        query["updated_at"] = {"$gte": start}
+    if end:
+        query["created_at"] = {"$lte": end}
+
+    cursor = db.conversations.find(
+        query,
+        {"user_id": 0},
+        batch_size=EXPORT_BATCH_SIZE,
+    ).sort("created_at", 1)
+
+    async for conv in cursor:
+        conversation_id = str(conv["_id"])
+        yield _export_line({
+            "type": "conversation",
+            "conversation_id": conversation_id,
+            "active": conv.get("active", False),
+            "created_at": conv.get("created_at"),
+            "updated_at": conv.get("updated_at"),
+            "closed_at": conv.get("closed_at"),
+        })
+
+        # Range filtering uses the archive index, so archived messages outside
+        # [start, end] are never decoded
+        for msg in conversationMessages(conv, start, end):
+            created_at = msg.get("created_at")
+            yield _export_line({
+                "type": "message",
+                "conversation_id": conversation_id,
+                "role": msg.get("role"),
+                "content": msg.get("content"),
+                "created_at": created_at,
+                "updated_at": msg.get("updated_at"),
+            })
+
+
+async def streamConversationExport(
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Stream all of a user's conversations and messages as NDJSON.
+
+    Documents are pulled from a Mongo cursor in small batches and written
+    out line by line, so memory stays flat regardless of history size.
+
+    Args:
+        user_id: User's ID
+        start: Only include messages created at or after this time
+        end: Only include messages created at or before this time
+        compress: Gzip the stream
+
+    Yields:
+        Chunks of NDJSON (optionally gzip-compressed) bytes
+    """
+
+    await flushUser(user_id)
+
+    if not compress:
+        async for line in _iterExportLines(user_id, start, end):
+            yield line
+        return
+
+    # wbits=31 produces a gzip container; sync-flush periodically so the
+    # client starts receiving data right away instead of after the last line
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    lines = 0
+    async for line in _iterExportLines(user_id, start, end):
+        chunk = compressor.compress(line)
+        lines += 1
+        if lines == 1 or lines % EXPORT_FLUSH_EVERY == 0:
+            chunk += compressor.flush(zlib.Z_SYNC_FLUSH)
+        if chunk:
+            yield chunk
+    yield compressor.flush()
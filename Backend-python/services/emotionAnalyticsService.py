@@ -0,0 +1,446 @@
+"""
+Incremental emotion-trend analytics.
+
+Instead of re-scanning every SentimentResult on each run, each user keeps a
+small running state that new analyze_text outputs are folded into:
+
+  • decayed_sums   – exponentially decayed score sum per label (half-life
+                     ANALYTICS_HALF_LIFE_DAYS), giving the "current" profile
+  • day_sums       – a fixed ring of ANALYTICS_TREND_DAYS daily score sums
+    day_counts       and item counts, used for daily/weekly trends
+    day_numbers
+
+All arrays have a fixed size, so an update costs O(new items) and a trend
+query costs O(ANALYTICS_TREND_DAYS), independent of how much history the
+user has. The llmContext string in aggregatedemotions is only rewritten when
+the decayed distribution has moved materially away from the aggregatedScores
+currently stored next to it. This service is the only writer of that
+document: the Node pipeline sends its new analyze_text results here rather
+than recomputing the aggregate itself.
+
+Every state document carries a version. Writes are conditional on the version
+that was read, so concurrent ingests (in this process or another worker)
+never overwrite each other; the loser reloads and folds again.
+"""
+
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from datetime import datetime, timezone
+
+import numpy as np
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from config.db import db
+
+# Labels produced by j-hartmann/emotion-english-distilroberta-base
+EMOTION_LABELS = ("anger", "disgust", "fear", "joy", "neutral", "sadness", "surprise")
+_LABEL_INDEX = {label: i for i, label in enumerate(EMOTION_LABELS)}
+_NUM_LABELS = len(EMOTION_LABELS)
+
+HALF_LIFE_DAYS = float(os.getenv("ANALYTICS_HALF_LIFE_DAYS", "7"))
+TREND_DAYS = int(os.getenv("ANALYTICS_TREND_DAYS", "28"))
+TOP_N_EMOTIONS = int(os.getenv("ANALYTICS_TOP_N", "3"))
+# Total-variation distance between the published and current distribution
+# above which llmContext is regenerated
+LLM_CONTEXT_THRESHOLD = float(os.getenv("ANALYTICS_LLM_CONTEXT_THRESHOLD", "0.1"))
+# Items stamped further than this in the future are rejected
+MAX_CLOCK_SKEW_SECONDS = float(os.getenv("ANALYTICS_MAX_CLOCK_SKEW_SECONDS", "300"))
+# Most recently ingested user states kept in memory
+STATE_CACHE_SIZE = int(os.getenv("ANALYTICS_STATE_CACHE_SIZE", "1000"))
+MAX_WRITE_ATTEMPTS = 3
+
+SECONDS_PER_DAY = 86_400
+
+
+@dataclass
+class EmotionState:
+    decayed_sums: np.ndarray = field(default_factory=lambda: np.zeros(_NUM_LABELS))
+    decayed_count: float = 0.0
+    last_update: float = 0.0  # unix seconds of the newest folded item
+    day_sums: np.ndarray = field(default_factory=lambda: np.zeros((TREND_DAYS, _NUM_LABELS)))
+    day_counts: np.ndarray = field(default_factory=lambda: np.zeros(TREND_DAYS, dtype=np.int64))
+    day_numbers: np.ndarray = field(default_factory=lambda: np.full(TREND_DAYS, -1, dtype=np.int64))
+    total_items: int = 0
+    version: int = 0  # 0 means not yet stored
+
+
+_states: OrderedDict[str, EmotionState] = OrderedDict()
+_index_ready = False
+
+
+# ---------------------------------------------------------------------------
+# STATE (DE)SERIALISATION
+# ---------------------------------------------------------------------------
+
+def _state_to_doc(user_id: str, state: EmotionState) -> dict:
+    return {
+        "user_id": user_id,
+        "labels": list(EMOTION_LABELS),
+        "decayed_sums": state.decayed_sums.tolist(),
+        "decayed_count": state.decayed_count,
+        "last_update": state.last_update,
+        "day_sums": state.day_sums.tolist(),
+        "day_counts": state.day_counts.tolist(),
+        "day_numbers": state.day_numbers.tolist(),
+        "total_items": state.total_items,
+        "version": state.version,
+        "updated_at": datetime.utcnow(),
+    }
+
+
+def _state_from_doc(doc: dict) -> EmotionState:
+    state = EmotionState(
+        decayed_sums=np.asarray(doc["decayed_sums"], dtype=np.float64),
+        decayed_count=float(doc["decayed_count"]),
+        last_update=float(doc["last_update"]),
+        total_items=int(doc.get("total_items", 0)),
+        version=int(doc.get("version", 1)),
+    )
+
+    # The ring is only reusable if its length still matches the config
+    if len(doc.get("day_counts", [])) == TREND_DAYS:
+        state.day_sums = np.asarray(doc["day_sums"], dtype=np.float64)
+        state.day_counts = np.asarray(doc["day_counts"], dtype=np.int64)
+        state.day_numbers = np.asarray(doc["day_numbers"], dtype=np.int64)
+    return state
+
+
+async def _read_state(user_id: str) -> EmotionState:
+    doc = await db.emotiontrends.find_one({"user_id": user_id})
+    return _state_from_doc(doc) if doc else EmotionState()
+
+
+def _copy_state(state: EmotionState) -> EmotionState:
+    return replace(
+        state,
+        decayed_sums=state.decayed_sums.copy(),
+        day_sums=state.day_sums.copy(),
+        day_counts=state.day_counts.copy(),
+        day_numbers=state.day_numbers.copy(),
+    )
+
+
+def _cache_state(user_id: str, state: EmotionState) -> None:
+    _states[user_id] = state
+    _states.move_to_end(user_id)
+    while len(_states) > STATE_CACHE_SIZE:
+        _states.popitem(last=False)
+
+
+async def _write_state(user_id: str, state: EmotionState) -> bool:
+    """
+    Store `state` only if nobody has written since it was read.
+    Returns False on a version conflict.
+    """
+    global _index_ready
+    if not _index_ready:
+        # The unique index makes two concurrent first inserts conflict
+        await db.emotiontrends.create_index("user_id", unique=True)
+        _index_ready = True
+
+    doc = _state_to_doc(user_id, replace(state, version=state.version + 1))
+    try:
+        if state.version == 0:
+            await db.emotiontrends.insert_one(doc)
+            return True
+        result = await db.emotiontrends.replace_one(
+            {"user_id": user_id, "version": state.version},
+            doc,
+        )
+        return result.matched_count == 1
+    except DuplicateKeyError:
+        return False
+
+
+# ---------------------------------------------------------------------------
+# VECTORISED HELPERS
+# ---------------------------------------------------------------------------
+
+def _scores_matrix(results: list) -> np.ndarray:
+    """
+    Convert analyze_text outputs into an (n_items, n_labels) matrix.
+    Accepts either [{label, score}, ...] or the nested [[{label, score}]]
+    shape some transformers versions return for a single string.
+
+    Unknown labels are ignored, but an item with no known label at all (or
+    only zero scores) is rejected rather than counted as an empty result.
+    """
+    matrix = np.zeros((len(results), _NUM_LABELS))
+    for row, result in enumerate(results):
+        if result and isinstance(result[0], list):
+            result = result[0]
+        for entry in result:
+            col = _LABEL_INDEX.get(str(entry["label"]).lower())
+            if col is not None:
+                matrix[row, col] = float(entry["score"])
+        if not matrix[row].any():
+            raise ValueError(
+                f"results[{row}] has no score for a known emotion label "
+                f"({', '.join(EMOTION_LABELS)})"
+            )
+    return matrix
+
+
+def _normalise(vector: np.ndarray) -> np.ndarray:
+    total = vector.sum(axis=-1, keepdims=True)
+    return np.divide(vector, total, out=np.zeros_like(vector), where=total > 0)
+
+
+def _decay(seconds: np.ndarray | float) -> np.ndarray | float:
+    return np.power(0.5, np.asarray(seconds) / (HALF_LIFE_DAYS * SECONDS_PER_DAY))
+
+
+def _fold(state: EmotionState, scores: np.ndarray, timestamps: np.ndarray) -> None:
+    """Fold a batch of items into the running state in place."""
+    newest = max(float(timestamps.max()), state.last_update)
+
+    # Age the existing state up to the newest timestamp, then add the new
+    # items each weighted by its own age relative to that point
+    state_factor = _decay(newest - state.last_update) if state.last_update else 0.0
+    weights = _decay(newest - timestamps)
+    state.decayed_sums = state.decayed_sums * state_factor + weights @ scores
+    state.decayed_count = state.decayed_count * state_factor + float(weights.sum())
+    state.last_update = newest
+
+    # Daily ring buffer: recycle any slot that still holds an older day
+    days = (timestamps // SECONDS_PER_DAY).astype(np.int64)
+    oldest_kept = int(newest // SECONDS_PER_DAY) - TREND_DAYS + 1
+    keep = days >= oldest_kept
+    days, scores = days[keep], scores[keep]
+
+    slots = days % TREND_DAYS
+    stale = state.day_numbers < oldest_kept
+    state.day_sums[stale] = 0.0
+    state.day_counts[stale] = 0
+    state.day_numbers[stale] = -1
+
+    unique_slots, first = np.unique(slots, return_index=True)
+    reused = state.day_numbers[unique_slots] != days[first]
+    state.day_sums[unique_slots[reused]] = 0.0
+    state.day_counts[unique_slots[reused]] = 0
+    state.day_numbers[unique_slots] = days[first]
+
+    np.add.at(state.day_sums, slots, scores)
+    np.add.at(state.day_counts, slots, 1)
+    state.total_items += len(timestamps)
+
+
+def _top_emotions(distribution: np.ndarray) -> list[dict]:
+    order = np.argsort(distribution)[::-1][:TOP_N_EMOTIONS]
+    return [
+        {"emotion": EMOTION_LABELS[i], "score": round(float(distribution[i]), 4)}
+        for i in order
+        if distribution[i] > 0
+    ]
+
+
+def _build_llm_context(top_emotions: list[dict]) -> str:
+    # Same wording as buildLlmContext in the Node aggregation service
+    if not top_emotions:
+        return ""
+
+    def fmt(e):
+        return f"{e['emotion']} ({round(e['score'] * 100)} %)"
+
+    first, *rest = top_emotions
+    if not rest:
+        return f"Recently the user has been feeling mostly {fmt(first)}."
+    return (
+        f"Recently the user has been feeling mostly {fmt(first)}, "
+        f"with some {', '.join(fmt(e) for e in rest)}."
+    )
+
+
+async def _published_distribution(user_id: str) -> np.ndarray | None:
+    # The scores stored alongside the live llmContext
+    doc = await db.aggregatedemotions.find_one(
+        {"userId": ObjectId(user_id)},
+        {"aggregatedScores": 1, "_id": 0},
+    )
+    scores = (doc or {}).get("aggregatedScores") or {}
+    vector = np.array([float(scores.get(label, 0.0)) for label in EMOTION_LABELS])
+    return _normalise(vector) if vector.any() else None
+
+
+def _is_material_change(published: np.ndarray | None, distribution: np.ndarray) -> bool:
+    if published is None:
+        return True
+    if int(np.argmax(published)) != int(np.argmax(distribution)):
+        return True
+    return 0.5 * float(np.abs(published - distribution).sum()) > LLM_CONTEXT_THRESHOLD
+
+
+async def _publish_llm_context(user_id: str, distribution: np.ndarray) -> str:
+    top = _top_emotions(distribution)
+    llm_context = _build_llm_context(top)
+    await db.aggregatedemotions.update_one(
+        {"userId": ObjectId(user_id)},
+        {
+            "$set": {
+                "aggregatedScores": {
+                    label: round(float(score), 4)
+                    for label, score in zip(EMOTION_LABELS, distribution)
+                },
+                "dominantEmotion": EMOTION_LABELS[int(np.argmax(distribution))],
+                "topEmotions": top,
+                "llmContext": llm_context,
+                "lastComputedAt": datetime.utcnow(),
+                "updatedAt": datetime.utcnow(),
+            },
+            "$setOnInsert": {"createdAt": datetime.utcnow()},
+        },
+        upsert=True,
+    )
+    return llm_context
+
+
+# ---------------------------------------------------------------------------
+# PUBLIC API
+# ---------------------------------------------------------------------------
+
+async def ingestEmotionResults(user_id: str, results: list, timestamps: list | None = None):
+    """
+    Fold new analyze_text outputs into the user's running emotion state.
+
+    Args:
+        user_id: User's ID
+        results: analyze_text outputs, one per analysed text
+        timestamps: Optional datetimes for each result (defaults to now)
+
+    Returns:
+        Dictionary with the current distribution and whether llmContext
+        was regenerated
+    """
+    if not results:
+        raise ValueError("results must be a non-empty list")
+    if timestamps is not None and len(timestamps) != len(results):
+        raise ValueError("timestamps must match results in length")
+
+    now = time.time()
+    ts = np.array(
+        [
+            (t.replace(tzinfo=t.tzinfo or timezone.utc).timestamp() if t else now)
+            for t in (timestamps or [None] * len(results))
+        ],
+        dtype=np.float64,
+    )
+    # A future timestamp would age out every real item and wipe the daily ring
+    if ts.max() > now + MAX_CLOCK_SKEW_SECONDS:
+        raise ValueError("timestamps must not be in the future")
+    ts = np.minimum(ts, now)
+    scores = _scores_matrix(results)
+
+    # Fold into a copy and only cache it once it is stored, so a failed or
+    # conflicting write never leaves the batch counted in memory
+    for _ in range(MAX_WRITE_ATTEMPTS):
+        cached = _states.get(user_id)
+        state = _copy_state(cached) if cached else await _read_state(user_id)
+        _fold(state, scores, ts)
+        try:
+            stored = await _write_state(user_id, state)
+        except Exception:
+            _states.pop(user_id, None)
+            raise
+        if stored:
+            state.version += 1
+            _cache_state(user_id, state)
+            break
+        # Someone else wrote first; drop our stale copy and retry from MongoDB
+        _states.pop(user_id, None)
+    else:
+        raise RuntimeError("Emotion state is being updated concurrently, try again")
+
+    distribution = _normalise(state.decayed_sums)
+    llm_context_updated = False
+    try:
+        # Nothing to describe yet; never overwrite a live llmContext with ""
+        if distribution.any() and _is_material_change(await _published_distribution(user_id), distribution):
+            await _publish_llm_context(user_id, distribution)
+            llm_context_updated = True
+    except Exception as exc:
+        # The batch is already stored, so failing here would make a client
+        # retry count it twice; the next ingest compares and publishes again
+        print(f"[emotionAnalyticsService] Could not publish llmContext for {user_id}: {exc}")
+
+    return {
+        "success": True,
+        "ingested": len(results),
+        "total_items": state.total_items,
+        "distribution": dict(zip(EMOTION_LABELS, np.round(distribution, 4).tolist())),
+        "dominant_emotion": EMOTION_LABELS[int(np.argmax(distribution))] if distribution.any() else None,
+        "llm_context_updated": llm_context_updated,
+    }
+
+
+async def getEmotionTrends(user_id: str, window: str = "daily", periods: int = 7):
+    """
+    Windowed emotion trends from the user's daily ring buffer.
+
+    Args:
+        user_id: User's ID
+        window: "daily" or "weekly"
+        periods: Number of most recent days/weeks to return
+
+    Returns:
+        Dictionary with per-period distributions and dominant-emotion shifts
+    """
+    if window not in ("daily", "weekly"):
+        raise ValueError("window must be 'daily' or 'weekly'")
+    span = 1 if window == "daily" else 7
+    if periods < 1 or periods * span > TREND_DAYS:
+        raise ValueError(f"periods must be between 1 and {TREND_DAYS // span} for a {window} window")
+
+    # Always read from MongoDB: another worker may have ingested since
+    state = await _read_state(user_id)
+
+    # Lay the ring out chronologically, ending today
+    today = int(time.time() // SECONDS_PER_DAY)
+    day_range = np.arange(today - periods * span + 1, today + 1, dtype=np.int64)
+    slots = day_range % TREND_DAYS
+    valid = state.day_numbers[slots] == day_range
+    sums = np.where(valid[:, None], state.day_sums[slots], 0.0)
+    counts = np.where(valid, state.day_counts[slots], 0)
+
+    # Collapse days into weeks with a reshape-and-sum
+    sums = sums.reshape(periods, span, _NUM_LABELS).sum(axis=1)
+    counts = counts.reshape(periods, span).sum(axis=1)
+    distributions = _normalise(sums)
+    dominant = np.argmax(distributions, axis=1)
+
+    period_starts = day_range[::span]
+    trend = []
+    for i in range(periods):
+        trend.append({
+            "period_start": datetime.fromtimestamp(
+                int(period_starts[i]) * SECONDS_PER_DAY, tz=timezone.utc
+            ).date().isoformat(),
+            "count": int(counts[i]),
+            "distribution": dict(zip(EMOTION_LABELS, np.round(distributions[i], 4).tolist())),
+            "dominant_emotion": EMOTION_LABELS[int(dominant[i])] if counts[i] else None,
+        })
+
+    # A shift is a change of dominant emotion between consecutive non-empty periods
+    active = np.flatnonzero(counts > 0)
+    changed = active[1:][dominant[active[1:]] != dominant[active[:-1]]]
+    previous = active[:-1][dominant[active[1:]] != dominant[active[:-1]]]
+    shifts = [
+        {
+            "period_start": trend[int(cur)]["period_start"],
+            "from": EMOTION_LABELS[int(dominant[prev])],
+            "to": EMOTION_LABELS[int(dominant[cur])],
+        }
+        for prev, cur in zip(previous, changed)
+    ]
+
+    current = _normalise(state.decayed_sums)
+    return {
+        "success": True,
+        "window": window,
+        "trend": trend,
+        "dominant_shifts": shifts,
+        "current_distribution": dict(zip(EMOTION_LABELS, np.round(current, 4).tolist())),
+        "total_items": state.total_items,
+    }
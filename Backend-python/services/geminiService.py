@@ -3,6 +3,13 @@ from config.db import db
 from datetime import datetime
 from dotenv import load_dotenv
 from bson import ObjectId
+from services.persistenceQueue import (
+    WRITE_BEHIND_ENABLED,
+    enqueueConversationWrite,
+    getPendingConversation,
+)
+from services.archiveService import conversationMessages
+from utils.tracing import span
 import os
 
 load_dotenv()
@@ -153,23 +160,85 @@ async def generateResponse(user_id: str, user_message: str):
  
     # ── 1. Gather all context in parallel (best-effort) ──────────────────────
     import asyncio
-    llm_context, user_profile = await asyncio.gather(
-        _get_llm_context(user_id),
-        _get_user_profile(user_id),
-    )
+    with span("context_fetch"):
+        llm_context, user_profile = await asyncio.gather(
+            _get_llm_context(user_id),
+            _get_user_profile(user_id),
+        )
  
     user_name: str = user_profile.get("name", "")
     user_age: int | None = user_profile.get("age")  # None if not set
  
-    system_prompt = _build_system_prompt(
-        llm_context=llm_context,
-        user_name=user_name,
-        user_age=user_age,
-    )
-    print(f"[geminiService] System prompt for {user_id}:\n{system_prompt}\n")
+    # Only the prompt size is traced; its content includes profile data
+    with span("prompt_build") as prompt_span:
+        system_prompt = _build_system_prompt(
+            llm_context=llm_context,
+            user_name=user_name,
+            user_age=user_age,
+        )
+        if prompt_span:
+            prompt_span.attributes["prompt_chars"] = len(system_prompt)
+ 
+    with span("history_build"):
+        conv, messages_for_gemini = await _build_history(user_id, user_message, user_name, system_prompt)
+ 
+    # ── 6. Call Gemini ────────────────────────────────────────────────────────
+    try:
+        with span("llm_call", model=MODEL_NAME, turns=len(messages_for_gemini)):
+            # Async client so the event loop keeps serving other requests
+            response = await client.aio.models.generate_content(
+                model=MODEL_NAME,
+                contents=messages_for_gemini,
+            )
+            assistant_reply = response.text
+ 
+        conv["messages"].append({
+            "role": "model",
+            "content": assistant_reply,
+            "created_at": datetime.now(),
+            "updated_at": datetime.now(),
+        })
+        conv["updated_at"] = datetime.now()
+ 
+        await _save_conversation(user_id, conv)
+ 
+        return {"reply": assistant_reply}
+ 
+    except Exception as e:
+        print(f"[geminiService] Error generating response: {e}")
+        error_reply = (
+            "I'm sorry, I ran into a problem while processing your message. "
+            "Please try again in a moment."
+        )
+ 
+        conv["messages"].append({
+            "role": "model",
+            "content": error_reply,
+            "created_at": datetime.now(),
+            "updated_at": datetime.now(),
+        })
+        conv["updated_at"] = datetime.now()
+ 
+        try:
+            await _save_conversation(user_id, conv)
+        except Exception as db_error:
+            print(f"[geminiService] Error persisting error reply: {db_error}")
+ 
+        return {"reply": error_reply, "error": str(e)}
+ 
  
+# ---------------------------------------------------------------------------
+# HELPERS
+# ---------------------------------------------------------------------------
+ 
+async def _build_history(user_id: str, user_message: str, user_name: str, system_prompt: str):
+    """
+    Load (or start) the active conversation and build the Gemini message
+    list for this turn. Returns (conversation document, messages).
+    """
     # ── 2. Fetch active conversation ─────────────────────────────────────────
-    conv = await db.conversations.find_one({
+    # A write still sitting in the write-behind queue is newer than MongoDB
+    conv = getPendingConversation(user_id) or await db.conversations.find_one({
         "user_id": user_id,
         "active": True,
     })
@@ -193,9 +262,12 @@ async def generateResponse(user_id: str, user_message: str):
             sort=[("created_at", -1)],
         )
  
-        if last_conv and last_conv.get("messages"):
+        # Closed conversations may be stored packed in an archive
+        last_messages = conversationMessages(last_conv) if last_conv else []
+
+        if last_messages:
             # Carry forward the previous conversation context
-            for msg in last_conv["messages"]:
+            for msg in last_messages:
                 messages_for_gemini.append({
                     "role": msg["role"],
                     "parts": [{"text": msg["content"]}],
@@ -267,61 +339,27 @@ async def generateResponse(user_id: str, user_message: str):
         "role": "user",
         "parts": [{"text": user_message}],
     })
+
+    return conv, messages_for_gemini
+
  
-    # ── 6. Call Gemini ────────────────────────────────────────────────────────
-    try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=messages_for_gemini,
-        )
-        assistant_reply = response.text
- 
-        conv["messages"].append({
-            "role": "model",
-            "content": assistant_reply,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now(),
-        })
-        conv["updated_at"] = datetime.now()
- 
+async def _save_conversation(user_id: str, conv: dict) -> None:
+    """
+    Persist the active conversation. In write-behind mode the write is
+    journaled and flushed in the background; otherwise it goes straight
+    to MongoDB.
+    """
+    with span("db_write", write_behind=WRITE_BEHIND_ENABLED):
+        if WRITE_BEHIND_ENABLED:
+            await enqueueConversationWrite(user_id, conv)
+            return
+
         await db.conversations.update_one(
             {"user_id": user_id, "active": True},
             {"$set": conv},
             upsert=True,
         )
- 
-        return {"reply": assistant_reply}
- 
-    except Exception as e:
-        print(f"[geminiService] Error generating response: {e}")
-        error_reply = (
-            "I'm sorry, I ran into a problem while processing your message. "
-            "Please try again in a moment."
-        )
- 
-        conv["messages"].append({
-            "role": "model",
-            "content": error_reply,
-            "created_at": datetime.now(),
-            "updated_at": datetime.now(),
-        })
-        conv["updated_at"] = datetime.now()
- 
-        try:
-            await db.conversations.update_one(
-                {"user_id": user_id, "active": True},
-                {"$set": conv},
-                upsert=True,
-            )
-        except Exception as db_error:
-            print(f"[geminiService] Error persisting error reply: {db_error}")
- 
-        return {"reply": error_reply, "error": str(e)}
- 
- 
-# ---------------------------------------------------------------------------
-# HELPERS
-# ---------------------------------------------------------------------------
+
  
 def _build_greeting(user_name: str) -> str:
     """Returns a personalised opening greeting for a new conversation."""
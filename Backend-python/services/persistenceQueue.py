@@ -0,0 +1,392 @@
+"""
+Write-behind persistence for chat conversations.
+
+When CHAT_WRITE_BEHIND is enabled, generateResponse hands the updated
+conversation to this queue instead of awaiting db.conversations.update_one,
+so the user only pays for the LLM round trip.
+
+  1. Journal   – every enqueued write is appended (and fsynced) to a local
+                 JSON-lines file before the caller returns, so a crash never
+                 loses an acknowledged reply.
+  2. Pending   – the latest conversation state per user is kept in memory.
+                 Writes are full-document $set updates (by _id, or an upsert
+                 for a brand-new conversation), so newer states simply
+                 replace older ones and a burst of turns costs one DB write.
+  3. Flusher   – a background task drains pending writes in batches with a
+                 single bulk_write, retrying with exponential backoff on
+                 failure. Writes MongoDB can never accept (duplicate key,
+                 oversized document) go to a dead-letter file instead of
+                 blocking the queue. After each flush the journal is compacted.
+
+Reads go through getPendingConversation first so a user always sees the
+writes they have just made, even before they reach MongoDB.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from config.db import db
+
+WRITE_BEHIND_ENABLED = os.getenv("CHAT_WRITE_BEHIND", "false").lower() in ("1", "true", "yes")
+JOURNAL_PATH = os.getenv("CHAT_JOURNAL_PATH", "data/conversation_journal.jsonl")
+FLUSH_INTERVAL_SECONDS = float(os.getenv("CHAT_FLUSH_INTERVAL_SECONDS", "0.5"))
+FLUSH_BATCH_SIZE = int(os.getenv("CHAT_FLUSH_BATCH_SIZE", "100"))
+RETRY_BASE_SECONDS = float(os.getenv("CHAT_FLUSH_RETRY_BASE_SECONDS", "0.5"))
+RETRY_MAX_SECONDS = float(os.getenv("CHAT_FLUSH_RETRY_MAX_SECONDS", "30"))
+DEAD_LETTER_PATH = f"{JOURNAL_PATH}.deadletter"
+
+# Reported for a write whose conversation was closed before it was flushed
+CLOSED_BEFORE_FLUSH = "conversation_closed"
+
+# Errors that will fail the same way on every retry: BadValue, FailedToParse,
+# DuplicateKey, BSONObjectTooLarge, document too large, and a closed target
+PERMANENT_ERROR_CODES = {2, 9, 11000, 10334, 17419, CLOSED_BEFORE_FLUSH}
+
+# user_id -> (sequence number, conversation document)
+_pending: dict[str, tuple[int, dict]] = {}
+_seq = 0
+_journal_lock = asyncio.Lock()
+_flush_lock = asyncio.Lock()
+_wakeup = asyncio.Event()
+_flusher_task: asyncio.Task | None = None
+_consecutive_failures = 0
+# Most recent writes that could never succeed; the full set is kept in DEAD_LETTER_PATH
+_dead_letters: deque = deque(maxlen=50)
+
+_stats = {
+    "enabled": WRITE_BEHIND_ENABLED,
+    "enqueued": 0,
+    "flushed": 0,
+    "flush_batches": 0,
+    "flush_failures": 0,
+    "dead_lettered": 0,
+    "replayed": 0,
+    "last_flush_at": None,
+    "last_flush_ms": None,
+    "last_error": None,
+    "last_error_at": None,
+}
+
+
+# ---------------------------------------------------------------------------
+# JOURNAL
+# ---------------------------------------------------------------------------
+
+def _append_journal_sync(line: str) -> None:
+    with open(JOURNAL_PATH, "a", encoding="utf-8") as fh:
+        fh.write(line)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+def _rewrite_journal_sync(lines: list[str]) -> None:
+    # Write to a sibling file and swap it in so a crash mid-compaction
+    # leaves either the old or the new journal, never a truncated one.
+    tmp_path = f"{JOURNAL_PATH}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as fh:
+        fh.writelines(lines)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp_path, JOURNAL_PATH)
+
+
+def _read_journal_sync() -> list[str]:
+    if not os.path.exists(JOURNAL_PATH):
+        return []
+    with open(JOURNAL_PATH, "r", encoding="utf-8") as fh:
+        return fh.readlines()
+
+
+def _journal_line(user_id: str, conv: dict) -> str:
+    return json_util.dumps({"user_id": user_id, "conv": conv}) + "\n"
+
+
+def _dead_letter_sync(lines: list[str]) -> None:
+    with open(DEAD_LETTER_PATH, "a", encoding="utf-8") as fh:
+        fh.writelines(lines)
+        fh.flush()
+        os.fsync(fh.fileno())
+
+
+# ---------------------------------------------------------------------------
+# PUBLIC API
+# ---------------------------------------------------------------------------
+
+async def enqueueConversationWrite(user_id: str, conv: dict) -> None:
+    """
+    Durably record the latest state of a user's active conversation and
+    schedule it for a background flush. Returns once the journal is fsynced.
+    """
+    global _seq
+
+    async with _journal_lock:
+        await asyncio.to_thread(_append_journal_sync, _journal_line(user_id, conv))
+        _seq += 1
+        _pending[user_id] = (_seq, conv)
+        _stats["enqueued"] += 1
+
+    if len(_pending) >= FLUSH_BATCH_SIZE:
+        _wakeup.set()
+
+
+def getPendingConversation(user_id: str) -> dict | None:
+    """Return the not-yet-flushed active conversation for a user, if any."""
+    entry = _pending.get(user_id)
+    return entry[1] if entry else None
+
+
+async def flushUser(user_id: str) -> None:
+    """
+    Persist any pending write for a single user right away.
+    Used before operations that must observe it in MongoDB, such as closing
+    the active conversation.
+    """
+    # Wait out an enqueue that is still fsyncing so its write is not missed
+    async with _journal_lock:
+        pass
+    if user_id in _pending:
+        await flushPending(only_user=user_id)
+
+
+async def flushPending(only_user: str | None = None) -> int:
+    """
+    Flush pending conversation writes to MongoDB in one unordered bulk_write.
+
+    Writes that succeed are removed from the queue. Writes rejected with a
+    permanent error (see PERMANENT_ERROR_CODES) are moved to the dead-letter
+    file so they cannot block the queue, as are updates whose conversation
+    was closed before they were flushed. Any other failure leaves the
+    affected writes pending and raises, so the flusher backs off and retries.
+
+    Returns the number of conversations written.
+    """
+    async with _flush_lock:
+        if only_user is not None:
+            batch = [(only_user, _pending[only_user])] if only_user in _pending else []
+        else:
+            batch = list(_pending.items())[:FLUSH_BATCH_SIZE]
+        if not batch:
+            return 0
+
+        # A conversation loaded from MongoDB is only ever updated in place:
+        # if it was closed meanwhile, the write must not recreate it as a new
+        # active document. Only brand-new conversations (no _id yet) upsert.
+        operations = []
+        for user_id, (_, conv) in batch:
+            fields = {k: v for k, v in conv.items() if k != "_id"}
+            if "_id" in conv:
+                operations.append(UpdateOne({"_id": conv["_id"], "active": True}, {"$set": fields}))
+            else:
+                operations.append(UpdateOne({"user_id": user_id, "active": True}, {"$set": fields}, upsert=True))
+
+        started = time.perf_counter()
+        write_errors: dict[int, dict] = {}
+        retry_all = None
+        try:
+            result = await db.conversations.bulk_write(operations, ordered=False)
+            matched, upserted = result.matched_count, result.upserted_count
+        except BulkWriteError as exc:
+            write_errors = {err["index"]: err for err in exc.details.get("writeErrors", [])}
+            matched, upserted = exc.details.get("nMatched", 0), exc.details.get("nUpserted", 0)
+            if exc.details.get("writeConcernErrors"):
+                # Unknown which writes stuck; the $set updates are safe to repeat
+                retry_all = exc
+        except Exception as exc:
+            retry_all = exc
+
+        if retry_all is not None:
+            _record_failure(retry_all)
+            raise retry_all
+
+        write_errors.update(await _find_closed_targets(batch, write_errors, matched, upserted))
+
+        transient = []
+        dead = []
+        async with _journal_lock:
+            for index, (user_id, (seq, conv)) in enumerate(batch):
+                error = write_errors.get(index)
+                if error is not None and error.get("code") not in PERMANENT_ERROR_CODES:
+                    transient.append(error)
+                    continue
+                if error is not None:
+                    dead.append((user_id, conv, error))
+                # Only drop entries that were not overwritten while we were flushing
+                current = _pending.get(user_id)
+                if current and current[0] == seq:
+                    del _pending[user_id]
+
+            if dead:
+                await asyncio.to_thread(_dead_letter_sync, [
+                    json_util.dumps({
+                        "user_id": user_id,
+                        "conv": conv,
+                        "code": error.get("code"),
+                        "error": error.get("errmsg"),
+                        "at": datetime.utcnow(),
+                    }) + "\n"
+                    for user_id, conv, error in dead
+                ])
+            remaining = [_journal_line(uid, conv) for uid, (_, conv) in _pending.items()]
+            await asyncio.to_thread(_rewrite_journal_sync, remaining)
+
+        for user_id, _, error in dead:
+            print(f"[persistenceQueue] Dead-lettered write for {user_id}: {error.get('errmsg')}")
+            _dead_letters.append({
+                "user_id": user_id,
+                "code": error.get("code"),
+                "error": error.get("errmsg"),
+                "at": datetime.utcnow(),
+            })
+        _stats["dead_lettered"] += len(dead)
+
+        written = len(batch) - len(dead) - len(transient)
+        _stats["flushed"] += written
+        _stats["flush_batches"] += 1
+        _stats["last_flush_at"] = datetime.utcnow()
+        _stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+        if transient:
+            exc = RuntimeError(f"{len(transient)} write(s) failed: {transient[0].get('errmsg')}")
+            _record_failure(exc)
+            raise exc
+        return written
+
+
+async def _find_closed_targets(batch: list, write_errors: dict, matched: int, upserted: int) -> dict:
+    """
+    Work out which in-place updates matched nothing because their
+    conversation had been closed. Returns synthetic write errors by index.
+    """
+    by_id, new_ok = {}, 0
+    for index, (_, (_, conv)) in enumerate(batch):
+        if index in write_errors:
+            continue
+        if "_id" in conv:
+            by_id[conv["_id"]] = index
+        else:
+            new_ok += 1
+
+    # Every new conversation either matched an active one or was upserted
+    missed = len(by_id) - (matched - (new_ok - upserted))
+    if missed <= 0:
+        return {}
+
+    still_active = {
+        doc["_id"]
+        async for doc in db.conversations.find(
+            {"_id": {"$in": list(by_id)}, "active": True}, {"_id": 1}
+        )
+    }
+    return {
+        index: {
+            "index": index,
+            "code": CLOSED_BEFORE_FLUSH,
+            "errmsg": "conversation was closed before the write was flushed",
+        }
+        for conv_id, index in by_id.items()
+        if conv_id not in still_active
+    }
+
+
+def _record_failure(exc: Exception) -> None:
+    _stats["flush_failures"] += 1
+    _stats["last_error"] = str(exc)
+    _stats["last_error_at"] = datetime.utcnow()
+
+
+def getQueueStats() -> dict:
+    """Snapshot of queue counters for the metrics endpoint."""
+    return {
+        **_stats,
+        "pending": len(_pending),
+        "consecutive_failures": _consecutive_failures,
+        "recent_dead_letters": list(_dead_letters),
+    }
+
+
+# ---------------------------------------------------------------------------
+# LIFECYCLE
+# ---------------------------------------------------------------------------
+
+async def _flusher_loop() -> None:
+    global _consecutive_failures
+
+    while True:
+        delay = FLUSH_INTERVAL_SECONDS
+        if _consecutive_failures:
+            delay = min(RETRY_BASE_SECONDS * 2 ** (_consecutive_failures - 1), RETRY_MAX_SECONDS)
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+
+        try:
+            while _pending:
+                await flushPending()
+            _consecutive_failures = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            _consecutive_failures += 1
+            print(f"[persistenceQueue] Flush failed (attempt {_consecutive_failures}): {exc}")
+
+
+async def startPersistenceQueue() -> None:
+    """Replay the journal left by a previous process and start the flusher."""
+    global _seq, _flusher_task
+
+    if not WRITE_BEHIND_ENABLED:
+        return
+
+    os.makedirs(os.path.dirname(JOURNAL_PATH) or ".", exist_ok=True)
+
+    async with _journal_lock:
+        for line in await asyncio.to_thread(_read_journal_sync):
+            if not line.strip():
+                continue
+            try:
+                record = json_util.loads(line)
+            except Exception:
+                # A torn final line from a crash mid-append; everything before it is intact
+                print("[persistenceQueue] Skipping unreadable journal line")
+                continue
+            _seq += 1
+            _pending[record["user_id"]] = (_seq, record["conv"])
+        _stats["replayed"] = len(_pending)
+
+    if _pending:
+        print(f"[persistenceQueue] Replaying {len(_pending)} journaled conversation(s)")
+        _wakeup.set()
+
+    _flusher_task = asyncio.create_task(_flusher_loop())
+
+
+async def stopPersistenceQueue() -> None:
+    """Stop the flusher and drain everything still pending."""
+    global _flusher_task
+
+    if not WRITE_BEHIND_ENABLED:
+        return
+
+    if _flusher_task:
+        _flusher_task.cancel()
+        try:
+            await _flusher_task
+        except asyncio.CancelledError:
+            pass
+        _flusher_task = None
+
+    try:
+        while _pending:
+            await flushPending()
+    except Exception as exc:
+        # Writes stay in the journal and are replayed on the next start
+        print(f"[persistenceQueue] Could not drain queue on shutdown: {exc}")
@@ -1,10 +1,18 @@
 from model_loader import classifier
+from utils.tracing import span
 
 def analyze_text(text: str):
     if not isinstance(text, str) or not text.strip():
         raise ValueError("text must be a non-empty string")
 
     try:
-        return classifier(text.strip(), top_k=None)
+        # Equivalent to classifier(text, top_k=None), split so the
+        # tokeniser and the model forward pass are traced separately
+        with span("tokenise"):
+            model_inputs = classifier.preprocess(text.strip())
+        with span("forward"):
+            model_outputs = classifier.forward(model_inputs)
+        scores = classifier.postprocess(model_outputs, top_k=None)
+        return sorted(scores, key=lambda item: item["score"], reverse=True)
     except Exception as exc:
-        raise RuntimeError("Sentiment model inference failed") from excs
\ No newline at end of file
+        raise RuntimeError("Sentiment model inference failed") from exc
@@ -0,0 +1,252 @@
+"""
+Admission control and per-client rate limiting.
+
+Requests are sorted into two priority classes by path:
+
+  • interactive – chat and conversation history (/api/generateText,
+                  /api/conversations...)
+  • batch       – sentiment scoring from the Node pipeline (/analyze,
+                  /analytics/emotions) and maintenance jobs (/maintenance)
+
+Each class has its own per-client token bucket and its own concurrency
+pool, so a pipeline backfill can only ever occupy the batch slots. Batch
+work is shed early with 503 + Retry-After when its wait queue is full or
+when interactive traffic is close to its own limit; clients over their
+token budget get 429 + Retry-After. Anything else passes straight through.
+
+Clients are identified by their remote address. The X-Client-ID header is
+only honoured when the request also carries the shared secret
+(X-Client-Secret matching ADMISSION_CLIENT_SECRET) or comes from an address
+listed in ADMISSION_TRUSTED_ADDRESSES; otherwise any caller could pick a
+fresh ID per request and never run out of tokens. All limits come from
+environment variables and the counters are exposed on GET /metrics.
+
+Batch callers are expected to cooperate: the Node sentiment client limits
+its own concurrency (PY_SENTIMENT_CONCURRENCY) and retries 429/503
+responses after the Retry-After delay, so shed requests are delayed rather
+than lost.
+"""
+
+import asyncio
+import hmac
+import math
+import os
+import time
+from collections import OrderedDict
+
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+
+from utils.tracing import span
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+INTERACTIVE_PATHS = ("/api/generateText", "/api/conversations", "/api/close-conversation")
+BATCH_PATHS = ("/analyze", "/analytics/emotions", "/maintenance")
+
+LIMITS = {
+    "interactive": {
+        "rate_per_second": float(os.getenv("ADMISSION_INTERACTIVE_RATE", "5")),
+        "burst": float(os.getenv("ADMISSION_INTERACTIVE_BURST", "20")),
+        "concurrency": int(os.getenv("ADMISSION_INTERACTIVE_CONCURRENCY", "64")),
+        "max_queue": int(os.getenv("ADMISSION_INTERACTIVE_MAX_QUEUE", "256")),
+        "queue_timeout_seconds": float(os.getenv("ADMISSION_INTERACTIVE_QUEUE_TIMEOUT", "10")),
+    },
+    "batch": {
+        "rate_per_second": float(os.getenv("ADMISSION_BATCH_RATE", "20")),
+        "burst": float(os.getenv("ADMISSION_BATCH_BURST", "40")),
+        "concurrency": int(os.getenv("ADMISSION_BATCH_CONCURRENCY", "2")),
+        "max_queue": int(os.getenv("ADMISSION_BATCH_MAX_QUEUE", "16")),
+        "queue_timeout_seconds": float(os.getenv("ADMISSION_BATCH_QUEUE_TIMEOUT", "5")),
+    },
+}
+# Shed batch work once interactive in-flight requests reach this share of
+# the interactive pool
+BATCH_SHED_INTERACTIVE_RATIO = float(os.getenv("ADMISSION_BATCH_SHED_INTERACTIVE_RATIO", "0.75"))
+# Least recently used buckets are evicted beyond this many clients
+MAX_TRACKED_BUCKETS = int(os.getenv("ADMISSION_MAX_TRACKED_BUCKETS", "10000"))
+# Who may name their own client ID with X-Client-ID
+CLIENT_SECRET = os.getenv("ADMISSION_CLIENT_SECRET", "")
+TRUSTED_ADDRESSES = frozenset(
+    address.strip()
+    for address in os.getenv("ADMISSION_TRUSTED_ADDRESSES", "").split(",")
+    if address.strip()
+)
+
+
+class _TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: float) -> float:
+        """Consume one token. Returns 0 on success, else seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate if rate > 0 else 60.0
+
+
+class _Pool:
+    def __init__(self, concurrency: int, max_queue: int, queue_timeout: float):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.waiting = 0
+
+
+_buckets: OrderedDict[tuple[str, str], _TokenBucket] = OrderedDict()
+_pools = {
+    name: _Pool(cfg["concurrency"], cfg["max_queue"], cfg["queue_timeout_seconds"])
+    for name, cfg in LIMITS.items()
+}
+_stats = {
+    name: {"admitted": 0, "rate_limited": 0, "shed": 0, "queue_timeouts": 0}
+    for name in LIMITS
+}
+
+
+def _classify(path: str) -> str | None:
+    if path.startswith(INTERACTIVE_PATHS):
+        return "interactive"
+    if path.startswith(BATCH_PATHS):
+        return "batch"
+    return None
+
+
+def _client_id(scope) -> str:
+    client = scope.get("client")
+    address = client[0] if client else "unknown"
+    headers = Headers(scope=scope)
+    claimed = headers.get("x-client-id")
+    if not claimed:
+        return address
+
+    secret = headers.get("x-client-secret", "")
+    if address in TRUSTED_ADDRESSES or (
+        CLIENT_SECRET and hmac.compare_digest(secret.encode(), CLIENT_SECRET.encode())
+    ):
+        return claimed
+    return address
+
+
+def _reject(status_code: int, detail: str, retry_after: float) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content={"detail": detail},
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def _get_bucket(key: tuple[str, str], burst: float) -> _TokenBucket:
+    # LRU: an evicted client simply starts again with a full bucket
+    bucket = _buckets.get(key)
+    if bucket is None:
+        bucket = _buckets[key] = _TokenBucket(burst)
+        if len(_buckets) > MAX_TRACKED_BUCKETS:
+            _buckets.popitem(last=False)
+    else:
+        _buckets.move_to_end(key)
+    return bucket
+
+
+class AdmissionControlMiddleware:
+    """
+    ASGI middleware enforcing rate limits and per-class concurrency.
+
+    Written against raw ASGI rather than BaseHTTPMiddleware so the pool
+    slot is held until the response body has been fully sent, which
+    matters for streaming responses such as the conversation export.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rejection, pool = await _admit(scope)
+        if rejection is not None:
+            await rejection(scope, receive, send)
+            return
+        if pool is None:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            pool.in_flight -= 1
+            pool.semaphore.release()
+
+
+async def _admit(scope) -> tuple[JSONResponse | None, _Pool | None]:
+    """
+    Apply the rate limit and acquire a pool slot for classified requests.
+    Returns (rejection response, None) or (None, acquired pool); the pool is
+    None for requests that are not subject to admission control.
+    """
+    priority = _classify(scope["path"]) if ADMISSION_ENABLED else None
+    if priority is None or scope["method"] == "OPTIONS":
+        return None, None
+
+    cfg = LIMITS[priority]
+    pool = _pools[priority]
+    stats = _stats[priority]
+
+    # ── 1. Per-client token bucket ───────────────────────────────────────────
+    bucket = _get_bucket((_client_id(scope), priority), cfg["burst"])
+    wait = bucket.take(cfg["rate_per_second"], cfg["burst"])
+    if wait:
+        stats["rate_limited"] += 1
+        return _reject(429, "Rate limit exceeded", wait), None
+
+    # ── 2. Shed batch work early while interactive traffic is busy ───────────
+    if priority == "batch":
+        interactive = _pools["interactive"]
+        if interactive.in_flight >= interactive.concurrency * BATCH_SHED_INTERACTIVE_RATIO:
+            stats["shed"] += 1
+            return _reject(503, "Server busy with interactive traffic", 1), None
+
+    if pool.waiting >= pool.max_queue:
+        stats["shed"] += 1
+        return _reject(503, "Too many queued requests", pool.queue_timeout), None
+
+    # ── 3. Wait for a slot in this class's pool ──────────────────────────────
+    pool.waiting += 1
+    try:
+        with span("queue", priority=priority):
+            await asyncio.wait_for(pool.semaphore.acquire(), timeout=pool.queue_timeout)
+    except asyncio.TimeoutError:
+        stats["queue_timeouts"] += 1
+        return _reject(503, "Timed out waiting for capacity", pool.queue_timeout), None
+    finally:
+        pool.waiting -= 1
+
+    pool.in_flight += 1
+    stats["admitted"] += 1
+    return None, pool
+
+
+def getAdmissionStats() -> dict:
+    """Snapshot of limits and counters for the metrics endpoint."""
+    return {
+        "enabled": ADMISSION_ENABLED,
+        "tracked_clients": len(_buckets),
+        "classes": {
+            name: {
+                "limits": LIMITS[name],
+                **_stats[name],
+                "in_flight": _pools[name].in_flight,
+                "waiting": _pools[name].waiting,
+            }
+            for name in LIMITS
+        },
+    }
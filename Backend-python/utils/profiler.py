@@ -0,0 +1,109 @@
+"""
+Opt-in sampling profiler.
+
+A daemon thread wakes every PROFILER_INTERVAL_MS, grabs the current stack of
+every other thread via sys._current_frames() and counts it, with the thread
+name as the root frame. That covers both the event loop and the thread pool
+that /analyze and /analytics/emotions run inference in. Nothing is
+hooked into the interpreter, so the profiled code runs at full speed and
+the cost is one stack walk per sample.
+
+Output is written to PROFILER_OUTPUT_DIR in the collapsed-stack format
+("frame;frame;frame count" per line) understood by flamegraph.pl,
+speedscope and inferno.
+
+Profiling is disabled unless PROFILER_ENABLED is set. It can then be
+triggered for a single request (X-Profile: 1 header) or for a time window
+(POST /debug/profile). Because requests share the event-loop thread and the
+thread pool, a per-request profile also contains whatever else the process
+was running concurrently.
+"""
+
+import os
+import re
+import sys
+import threading
+from collections import Counter
+from datetime import datetime
+
+PROFILER_ENABLED = os.getenv("PROFILER_ENABLED", "false").lower() in ("1", "true", "yes")
+PROFILER_INTERVAL_MS = float(os.getenv("PROFILER_INTERVAL_MS", "5"))
+PROFILER_OUTPUT_DIR = os.getenv("PROFILER_OUTPUT_DIR", "data/profiles")
+PROFILER_MAX_WINDOW_SECONDS = float(os.getenv("PROFILER_MAX_WINDOW_SECONDS", "300"))
+
+# Only one sampler at a time keeps overhead bounded
+_active_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    def __init__(self, label: str):
+        self.label = re.sub(r"[^A-Za-z0-9_-]", "_", label)[:64]
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{self.label}", daemon=True)
+
+    def _run(self) -> None:
+        interval = PROFILER_INTERVAL_MS / 1000
+        own_id = threading.get_ident()
+        while not self._stop.wait(interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, f"thread-{thread_id}"))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> str:
+        """Stop sampling and write the collapsed stacks. Returns the file path."""
+        self._stop.set()
+        self._thread.join()
+
+        os.makedirs(PROFILER_OUTPUT_DIR, exist_ok=True)
+        timestamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        path = os.path.join(PROFILER_OUTPUT_DIR, f"{timestamp}-{self.label}.folded")
+        with open(path, "w", encoding="utf-8") as fh:
+            for stack, count in self.samples.most_common():
+                fh.write(f"{stack} {count}\n")
+        return path
+
+
+def startProfiler(label: str) -> SamplingProfiler | None:
+    """
+    Start sampling all threads. Returns None when profiling is disabled or
+    another profile is already running.
+    """
+    if not PROFILER_ENABLED or not _active_lock.acquire(blocking=False):
+        return None
+    profiler = SamplingProfiler(label)
+    profiler.start()
+    return profiler
+
+
+def stopProfiler(profiler: SamplingProfiler) -> str:
+    try:
+        path = profiler.stop()
+    finally:
+        _active_lock.release()
+    print(f"[profiler] Wrote {sum(profiler.samples.values())} samples to {path}")
+    return path
+
+
+def profileWindow(seconds: float, label: str = "window") -> bool:
+    """
+    Sample all threads for a fixed window without blocking the caller.
+    Returns False if profiling is disabled or already running.
+    """
+    seconds = min(seconds, PROFILER_MAX_WINDOW_SECONDS)
+    profiler = startProfiler(label)
+    if profiler is None:
+        return False
+    threading.Timer(seconds, stopProfiler, args=(profiler,)).start()
+    return True
@@ -0,0 +1,290 @@
+"""
+Request-scoped tracing.
+
+Each HTTP request gets a request ID (taken from the X-Request-ID header when
+the caller sends one) and a trace that collects timed spans for the stages
+of that request:
+
+    with span("llm_call", model=MODEL_NAME):
+        ...
+
+Spans nest, work in both sync and async code, and are no-ops outside a
+request. When the request finishes the trace is written as one JSON line to
+the "ren.trace" logger and, if OTEL_EXPORTER_OTLP_ENDPOINT is set, sent to
+an OTLP/HTTP collector by a single exporter thread. The exporter has its own
+bounded queue and drops traces when it is full, so a slow or unreachable
+collector never backs up request handling or the shared thread pool.
+
+Only timings and caller-supplied attributes are recorded, never prompts or
+user profile data.
+"""
+
+import json
+import logging
+import os
+import queue
+import secrets
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from utils.profiler import startProfiler, stopProfiler
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() in ("1", "true", "yes")
+OTLP_ENDPOINT = os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "").rstrip("/")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "ren-backend-python")
+OTLP_QUEUE_SIZE = int(os.getenv("OTLP_QUEUE_SIZE", "1000"))    # traces
+OTLP_MAX_BATCH = int(os.getenv("OTLP_MAX_BATCH", "100"))       # traces per POST
+
+logger = logging.getLogger("ren.trace")
+if not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+@dataclass
+class Span:
+    name: str
+    span_id: str
+    parent_id: str | None
+    start_ns: int
+    end_ns: int = 0
+    attributes: dict = field(default_factory=dict)
+    error: str | None = None
+
+
+@dataclass
+class Trace:
+    request_id: str
+    trace_id: str
+    name: str
+    spans: list[Span] = field(default_factory=list)
+    stack: list[str] = field(default_factory=list)
+
+
+_current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+
+
+def _new_id(num_bytes: int) -> str:
+    return secrets.token_hex(num_bytes)
+
+
+def currentRequestId() -> str | None:
+    trace = _current_trace.get()
+    return trace.request_id if trace else None
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Time a stage of the current request. Does nothing outside a trace."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+
+    record = Span(
+        name=name,
+        span_id=_new_id(8),
+        parent_id=trace.stack[-1] if trace.stack else None,
+        start_ns=time.time_ns(),
+        attributes=attributes,
+    )
+    trace.spans.append(record)
+    trace.stack.append(record.span_id)
+    try:
+        yield record
+    except BaseException as exc:
+        record.error = type(exc).__name__
+        raise
+    finally:
+        record.end_ns = time.time_ns()
+        trace.stack.pop()
+
+
+@contextmanager
+def requestTrace(name: str, request_id: str | None = None):
+    """
+    Open the root span for a request and emit the finished trace.
+    Yields the Trace so the caller can read its request_id.
+    """
+    if not TRACING_ENABLED:
+        yield Trace(request_id=request_id or _new_id(8), trace_id="", name=name)
+        return
+
+    trace = Trace(request_id=request_id or _new_id(8), trace_id=_new_id(16), name=name)
+    token = _current_trace.set(trace)
+    try:
+        with span(name) as root:
+            yield trace
+    finally:
+        _current_trace.reset(token)
+        _emit(trace, root)
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware that traces each HTTP request and echoes X-Request-ID.
+    Send "X-Profile: 1" to also sample the request (needs PROFILER_ENABLED).
+
+    The root span closes only after the response body has been sent, so
+    streaming responses are timed in full.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+        with requestTrace(f"{scope['method']} {scope['path']}", headers.get("x-request-id")) as trace:
+
+            async def send_with_request_id(message):
+                if message["type"] == "http.response.start":
+                    MutableHeaders(scope=message)["X-Request-ID"] = trace.request_id
+                await send(message)
+
+            profiler = startProfiler(trace.request_id) if headers.get("x-profile") == "1" else None
+            try:
+                await self.app(scope, receive, send_with_request_id)
+            finally:
+                if profiler:
+                    stopProfiler(profiler)
+
+
+# ---------------------------------------------------------------------------
+# EXPORT
+# ---------------------------------------------------------------------------
+
+def _emit(trace: Trace, root: Span) -> None:
+    logger.info(json.dumps({
+        "event": "trace",
+        "request_id": trace.request_id,
+        "trace_id": trace.trace_id,
+        "name": trace.name,
+        "duration_ms": round((root.end_ns - root.start_ns) / 1e6, 2),
+        "spans": [
+            {
+                "name": s.name,
+                "span_id": s.span_id,
+                "parent_id": s.parent_id,
+                "start_offset_ms": round((s.start_ns - root.start_ns) / 1e6, 2),
+                "duration_ms": round((s.end_ns - s.start_ns) / 1e6, 2),
+                **({"attributes": s.attributes} if s.attributes else {}),
+                **({"error": s.error} if s.error else {}),
+            }
+            for s in trace.spans
+        ],
+    }, default=str))
+
+    if OTLP_ENDPOINT:
+        _exporter.submit(trace)
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _span_to_otlp(trace: Trace, s: Span) -> dict:
+    return {
+        "traceId": trace.trace_id,
+        "spanId": s.span_id,
+        **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+        "name": s.name,
+        "kind": 2 if s.parent_id is None else 1,  # SERVER / INTERNAL
+        "startTimeUnixNano": str(s.start_ns),
+        "endTimeUnixNano": str(s.end_ns),
+        "attributes": [
+            {"key": "request.id", "value": {"stringValue": trace.request_id}},
+            *({"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()),
+        ],
+        "status": {"code": 2, "message": s.error} if s.error else {},
+    }
+
+
+def _export_otlp(traces: list[Trace]) -> None:
+    # OTLP/HTTP JSON encoding, see opentelemetry-proto trace/v1
+    body = {
+        "resourceSpans": [{
+            "resource": {"attributes": [
+                {"key": "service.name", "value": {"stringValue": SERVICE_NAME}},
+            ]},
+            "scopeSpans": [{
+                "scope": {"name": "ren.tracing"},
+                "spans": [_span_to_otlp(trace, s) for trace in traces for s in trace.spans],
+            }],
+        }],
+    }
+    request = urllib.request.Request(
+        f"{OTLP_ENDPOINT}/v1/traces",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    urllib.request.urlopen(request, timeout=5).close()
+
+
+class _OtlpExporter:
+    """One background thread draining a bounded queue of finished traces."""
+
+    def __init__(self):
+        self.queue: queue.Queue = queue.Queue(maxsize=OTLP_QUEUE_SIZE)
+        self.thread: threading.Thread | None = None
+        self.start_lock = threading.Lock()
+        self.dropped = 0
+        self.failed = 0
+
+    def submit(self, trace: Trace) -> None:
+        if self.thread is None:
+            with self.start_lock:
+                if self.thread is None:
+                    self.thread = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+                    self.thread.start()
+        try:
+            self.queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < OTLP_MAX_BATCH:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                _export_otlp(batch)
+            except Exception as exc:
+                self.failed += len(batch)
+                print(f"[tracing] OTLP export of {len(batch)} trace(s) failed: {exc}")
+
+
+_exporter = _OtlpExporter()
+
+
+def getTracingStats() -> dict:
+    """Exporter counters for the metrics endpoint."""
+    return {
+        "enabled": TRACING_ENABLED,
+        "otlp_endpoint": OTLP_ENDPOINT or None,
+        "otlp_queued": _exporter.queue.qsize(),
+        "otlp_dropped": _exporter.dropped,
+        "otlp_failed": _exporter.failed,
+    }